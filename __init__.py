@@ -1,5 +1,8 @@
-from queue import Queue
+import re
+import time
+import threading
 import sublime
+from contextlib import contextmanager
 
 
 ##
@@ -22,14 +25,26 @@ class SettingContainer:
     ##
     # @param      self  The object
     ##
-    # @return     { None }
+    # @return     { True if the credentials changed }
     ##
     def refresh(self):
+        old_credentials = self.credentials()
         self.settings = sublime.load_settings('github_issue.sublime-settings')
         for flag in ("token", "username", "password", "debug", "syntax", "git_path", "issue_title_completion",
                      "user_completion", "label_completion", "commit_completion","split_line_width",
-                     "commit_completion_trigger", "disable_local_repositories", "wrap_width", "draw_centered", "disable_vintageous"):
+                     "commit_completion_trigger", "disable_local_repositories", "wrap_width", "draw_centered", "disable_vintageous",
+                     "http_cache_size", "pool_connections", "pool_maxsize",
+                     "issue_prefetch", "issue_prefetch_rows", "issue_prefetch_delay",
+                     "search_result_limit", "completion_limit", "metadata_cache_size",
+                     "spill_hidden_views", "cursor_guard_probe", "trace",
+                     "large_issue_comments", "large_issue_size", "infinite_scroll", "infinite_scroll_rows"):
             self.setting_dictionary[flag] = self.settings.get(flag)
+        marker_table.invalidate()
+        logger.invalidate()
+        return old_credentials != self.credentials()
+
+    def credentials(self):
+        return tuple(self.setting_dictionary.get(flag) for flag in ("token", "username", "password"))
 
     ##
     # @brief      get corresponding parameters from Setting Object
@@ -57,48 +72,216 @@ class FlagContainer:
                                  }
 
 
-def log(info):
-    debug_flag = sublime.load_settings("github_issue.sublime-settings").get('debug', 0)
-    if debug_flag != 0:
-        print("GitHub Issue >>> " + info)
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+
+
+class Logger:
+    '''
+    Console logger of the plug-in. The level is read from the settings once
+    and cached until the next refresh, and a message is only formatted with
+    its arguments when it is printed. With "trace" on, every job collects
+    the time spent in network, render and parse spans and prints a summary.
+    '''
+
+    def __init__(self):
+        self.level = None
+        self.tracing = False
+        self.local = threading.local()
+
+    def invalidate(self):
+        self.level = None
+
+    def configure(self):
+        plugin_settings = sublime.load_settings("github_issue.sublime-settings")
+        self.tracing = bool(plugin_settings.get("trace", False))
+        self.level = DEBUG if plugin_settings.get("debug", 0) != 0 else WARNING
+        return self.level
+
+    def log(self, level, message, *args):
+        if level >= (self.level or self.configure()):
+            if args:
+                message = message.format(*args)
+            if level >= WARNING:
+                print("GitHub Issue [{}] >>> {}".format(LEVEL_NAMES[level], message))
+            else:
+                print("GitHub Issue >>> " + message)
+
+    def begin_trace(self, name):
+        if self.level is None:
+            self.configure()
+        if not self.tracing:
+            return None
+        trace = Trace(name)
+        self.local.trace = trace
+        return trace
+
+    def end_trace(self, trace):
+        if trace is not None:
+            self.local.trace = None
+            print("GitHub Issue [trace] >>> " + trace.report())
+
+    @contextmanager
+    def span(self, category):
+        '''
+        Time the enclosed block as a network, render or parse span.
+        '''
+        if self.level is None:
+            self.configure()
+        if not self.tracing:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            trace = getattr(self.local, "trace", None)
+            if trace is not None:
+                trace.add(category, elapsed)
+            else:
+                print("GitHub Issue [trace] >>> {} {:.1f} ms".format(category, elapsed * 1000))
+
+
+class Trace:
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = {}
+
+    def add(self, category, elapsed):
+        total, count = self.spans.get(category, (0.0, 0))
+        self.spans[category] = (total + elapsed, count + 1)
+
+    def report(self):
+        parts = ["{} {:.1f} ms ({})".format(category, total * 1000, count)
+                 for category, (total, count) in sorted(self.spans.items())]
+        return "{} {:.1f} ms: {}".format(self.name, (time.perf_counter() - self.start) * 1000,
+                                         ", ".join(parts) or "no spans")
+
+
+logger = Logger()
+
+
+def log(message, *args):
+    logger.log(DEBUG, message, *args)
+
+
+def warn(message, *args):
+    logger.log(WARNING, message, *args)
+
+
+def span(category):
+    return logger.span(category)
 
 
 LINE_END = "\n"
 settings = SettingContainer()
 flag_container = FlagContainer()
-issue_obj_storage = Queue()
-repo_info_storage = Queue()
-global_title_list = {}
 global_person_list = {}
-global_label_list = {}
-global_commit_list = {}
-issue_obj_storage.put({})
-repo_info_storage.put({})
-COMMENT_START = lambda x: format_split("*" + "<" * 26 + "START <Comment {}>".format(str(x)) + ">" * 26 + "*")
-COMMENT_END = lambda x: format_split("*" + ">" * 26 + "END   <Comment {}>".format(str(x)) + "<" * 26 + "*")
-COMMENT_INFO = lambda x, y: format_split("*" + "-" * 9 + "<commented by " + x + "   UpdateTime: " + y + '>' + "-" * 9 + '*')
-ISSUE_START = lambda: format_split("*" + "<" * 33 + "ISSUE START" + ">" * 33 + "*")
-ISSUE_END = lambda: format_split("*" + ">" * 33 + "ISSUE   END" + "<" * 33 + "*")
-HEADER_END = lambda: format_split("*" + "=" * 33 + "**CONTENT**" + "=" * 33 + "*")
-CONTENT_END = lambda: format_split("*" + "=" * 35 + "**END**" + "=" * 35 + "*")
-ADD_COMMENT = lambda: format_split("*" + "-" * 31 + "ADD NEW COMMENT" + "-" * 31 + "*")
-
-
-def format_split(line):
+COMMENT_START_LINE = "*" + "<" * 26 + "START <Comment {}>" + ">" * 26 + "*"
+COMMENT_END_LINE = "*" + ">" * 26 + "END   <Comment {}>" + "<" * 26 + "*"
+COMMENT_COLLAPSED_LINE = "*" + "<" * 24 + "COLLAPSED <Comment {}>" + ">" * 24 + "*"
+COMMENT_INFO_LINE = "*" + "-" * 9 + "<commented by {}   UpdateTime: {}>" + "-" * 9 + "*"
+SPLIT_LINES = {"issue_start": "*" + "<" * 33 + "ISSUE START" + ">" * 33 + "*",
+               "issue_end": "*" + ">" * 33 + "ISSUE   END" + "<" * 33 + "*",
+               "header_end": "*" + "=" * 33 + "**CONTENT**" + "=" * 33 + "*",
+               "content_end": "*" + "=" * 35 + "**END**" + "=" * 35 + "*",
+               "add_comment": "*" + "-" * 31 + "ADD NEW COMMENT" + "-" * 31 + "*"}
+
+
+class MarkerTable:
+    '''
+    Split lines fitted to the configured width, plus the regexes that find
+    them, built once and dropped by SettingContainer.refresh.
+    '''
+
+    def __init__(self):
+        self.table = None
+
+    def invalidate(self):
+        self.table = None
+
+    def get(self, name):
+        table = self.table
+        if table is None:
+            table = self.build()
+        return table[name]
+
+    def split(self, line):
+        return fit_split(line, self.get("width"))
+
+    def build(self):
+        width = split_width()
+        table = dict((name, fit_split(line, width)) for name, line in SPLIT_LINES.items())
+        table["width"] = width
+        table["guard"] = frozenset(table[name] for name in SPLIT_LINES)
+        fake_lines = [fit_split(COMMENT_START_LINE.format(""), width)[:25],
+                      fit_split(COMMENT_END_LINE.format(""), width)[:25],
+                      fit_split(COMMENT_COLLAPSED_LINE.format(""), width)[:25]]
+        fake_lines.extend(table[name] for name in ("issue_start", "issue_end", "header_end",
+                                                   "content_end", "add_comment"))
+        # a body line starting like a marker, to be pushed aside with a space
+        table["fake"] = re.compile("^(?={})".format("|".join(re.escape(line) for line in fake_lines)),
+                                   re.MULTILINE)
+        # every marker line in split_issue order, the group name tells its type
+        table["line"] = re.compile(
+            r"\s*(?:(?P<header_end>{header_end})|(?P<issue_start>{issue_start})|(?P<issue_end>{issue_end})|"
+            r"(?P<comment_start>\*<+START\s+<Comment\D*(?P<start_id>\d+))|"
+            r"(?P<comment_end>\*>+END\s+<Comment\D*(?P<end_id>\d+))|"
+            r"(?P<comment_collapsed>\*<+COLLAPSED\s+<Comment\D*(?P<collapsed_id>\d+))|"
+            r"(?P<add_comment>{add_comment})|(?P<content_end>{content_end}))".format(
+                **dict((name, re.escape(table[name])) for name in SPLIT_LINES)))
+        self.table = table
+        return table
+
+
+marker_table = MarkerTable()
+COMMENT_START = lambda x: marker_table.split(COMMENT_START_LINE.format(x))
+COMMENT_END = lambda x: marker_table.split(COMMENT_END_LINE.format(x))
+COMMENT_COLLAPSED = lambda x: marker_table.split(COMMENT_COLLAPSED_LINE.format(x))
+COMMENT_INFO = lambda x, y: marker_table.split(COMMENT_INFO_LINE.format(x, y))
+ISSUE_START = lambda: marker_table.get("issue_start")
+ISSUE_END = lambda: marker_table.get("issue_end")
+HEADER_END = lambda: marker_table.get("header_end")
+CONTENT_END = lambda: marker_table.get("content_end")
+ADD_COMMENT = lambda: marker_table.get("add_comment")
+
+
+def split_width():
     split_line_width = settings.get("split_line_width", 0)
     wrap_width = settings.get("wrap_width", 80)
     if split_line_width > wrap_width or split_line_width == 0:
         split_line_width = wrap_width
         if wrap_width == 80 or wrap_width == 0:
-            return line
+            return 0
+    return split_line_width
+
+
+def fit_split(line, width):
+    '''
+    Stretch or shrink a split line to width - 1 characters by repeating or
+    dropping the characters next to both ends, the end side first.
+    '''
+    if width == 0:
+        return line
+    extra = len(line) - (width - 1)
+    if extra > 0 and extra <= len(line) - 2:
+        return line[0] + line[1 + extra // 2:len(line) - 1 - (extra + 1) // 2] + line[-1]
+    if extra < 0 and len(line) >= 3:
+        return line[0] + line[1] * ((1 - extra) // 2) + line[1:-1] + line[-2] * (-extra // 2) + line[-1]
     line = list(line)
-    while len(line) != split_line_width - 1:
-        if len(line) > split_line_width - 1:
+    while len(line) != width - 1:
+        if len(line) > width - 1:
             line.pop(-2)
-        if len(line) > split_line_width - 1:
+        if len(line) > width - 1:
             line.pop(1)
-        if len(line) < split_line_width - 1:
+        if len(line) < width - 1:
             line.insert(1, line[1])
-        if len(line) < split_line_width - 1:
+        if len(line) < width - 1:
             line.insert(-1, line[-2])
     return "".join(line)
@@ -1,37 +1,21 @@
 import sublime_plugin
 import sublime
 from . import log
-from . import COMMENT_START, COMMENT_END
-from .libgit.utils import ViewConverter
+from .libgit.utils import get_structure, mark_structure_dirty
+import bisect
 
 
 class EraseCurrentCommentFromViewCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         current_point = self.view.sel()[0].a
-        row, col = self.view.rowcol(current_point)
-        view_converter = ViewConverter(self.view)
-        view_lines = view_converter.readlines()
-        crucial_lines = ViewConverter.split_issue(view_lines)
-        for idx, line in enumerate(crucial_lines['comment_start']):
-            if row > line.idx:
-                continue
-            elif row == line.idx:
-                comment_start = crucial_lines['comment_start'][idx]
-            else:
-                comment_start = crucial_lines['comment_start'][idx - 1]
-                break
-        else:
-            comment_start = crucial_lines['comment_start'][-1]
-        for idx, line in enumerate(crucial_lines['comment_end']):
-            if row > line.idx:
-                continue
-            else:
-                comment_end = crucial_lines['comment_end'][idx]
-                break
-        else:
+        markers = get_structure(self.view).markers()
+        starts = [marker.a for marker in markers['comment_start']]
+        index = bisect.bisect_right(starts, current_point) - 1
+        if index < 0 or markers['comment_end'][index].b < self.view.line(current_point).a:
             raise Exception("Something wrong with comment splitting")
-        view_lines = self.view.lines(sublime.Region(0, self.view.size()))
-        self.view.erase(edit, sublime.Region(view_lines[comment_start.idx].a, view_lines[comment_end.idx].b + 1))
+        comment_start = markers['comment_start'][index]
+        comment_end = markers['comment_end'][index]
+        self.view.erase(edit, sublime.Region(comment_start.a, comment_end.b + 1))
 
 
 class EraseCurrentCommentCommand(sublime_plugin.WindowCommand):
@@ -45,12 +29,14 @@ class InsertIssueSnippetCommand(sublime_plugin.TextCommand):
 
     def run(self, edit, start_point=0, snippet=None):
         if snippet:
+            mark_structure_dirty(self.view, snippet)
             self.view.insert(edit, start_point, snippet)
 
 
 class EraseSnippetCommand(sublime_plugin.TextCommand):
 
     def run(self, edit, start_point=0, end_point=0):
+        mark_structure_dirty(self.view, self.view.substr(sublime.Region(start_point, end_point)))
         self.view.erase(edit, sublime.Region(start_point, end_point))
 
 
@@ -58,6 +44,7 @@ class ReplaceSnippetCommand(sublime_plugin.TextCommand):
 
     def run(self, edit, start_point, end_point, snippet):
         if snippet:
+            mark_structure_dirty(self.view, snippet)
             self.view.replace(edit, sublime.Region(
                 start_point, end_point), snippet)
 
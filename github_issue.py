@@ -3,9 +3,14 @@ import sublime_plugin
 from .libgit import issue
 from .libgit import utils
 from .libgit import github
+from .libgit import cache
+from .libgit import scheduler
+from .libgit import singleflight
+from .libgit import worker
+from .libgit import completion
 from . import flag_container as fc
 from . import log, LINE_END, settings
-from . import repo_info_storage, issue_obj_storage
+from .libgit.state import repo_info_storage, issue_obj_storage, RepoEntry
 import re
 from queue import Queue
 from functools import partial
@@ -24,28 +29,33 @@ def plugin_loaded():
     imp.reload(github)
     global active_issue_obj, settings
     settings.refresh()
-    settings.settings.add_on_change("github_issue_reload", settings.refresh)
+    settings.settings.add_on_change("github_issue_reload", reload_settings)
     active_issue_obj = issue.GitRepo(settings)
 
 
+def reload_settings():
+    if settings.refresh():
+        github.reset_transports()
+
+
 class ChangeIssuePageCommand(sublime_plugin.TextCommand):
 
     def is_enabled(self):
         syntax_name = self.view.settings().get('syntax')
         if syntax_name == "Packages/GitHubIssue/list.sublime-syntax":
-            return True
+            return not self.view.settings().get("search_flag")
         return False
 
     def run(self, edit, command):
         global active_issue_obj
-        log("we have the command {}".format(command))
+        log("we have the command {}", command)
         view_text = "_{}_".format(command.capitalize())
-        log("we are matching {}".format(view_text))
+        log("we are matching {}", view_text)
         for flag in fc.pagination_flags.keys():
             fc.pagination_flags[flag] = False
-            log("{} set to False".format(flag))
+            log("{} set to False", flag)
             if flag == view_text:
-                log("flag matches, set {} to True".format(flag))
+                log("flag matches, set {} to True", flag)
                 fc.pagination_flags[flag] = True
         print_next_page_issues = issue.PrintListInView(
             self.view, active_issue_obj, repo_info_storage, command, False)
@@ -118,6 +128,14 @@ class ShowGithubIssueCommand(sublime_plugin.WindowCommand):
             raise Exception("Cannot find repo information!")
 
 
+class SearchGithubIssuesCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        repo_loader = LoadRepoList()
+        repo_loader.format_entries()
+        repo_loader.show_panel_then_search()
+
+
 class NewGithubIssueCommand(sublime_plugin.WindowCommand):
 
     def run(self):
@@ -142,7 +160,7 @@ class UpdateGithubIssueCommand(sublime_plugin.WindowCommand):
     def run(self):
         global active_issue_obj
         self.view = sublime.active_window().active_view()
-        if not repo_info_storage.empty():
+        if self.view.id() in repo_info_storage:
             active_issue_obj.find_repo_info(self.view, repo_info_storage)
         else:
             raise Exception("Error in obtaining Repo Info!")
@@ -151,6 +169,58 @@ class UpdateGithubIssueCommand(sublime_plugin.WindowCommand):
         update_issue.start()
 
 
+class ShowGithubIssueStatsCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        cache_stats = cache.http_cache.stats()
+        lines = ["GitHub Issue statistics",
+                 "response cache: {entries} entries, {bytes}/{max_bytes} bytes, "
+                 "{hits} hits, {misses} misses, {bytes_saved} bytes saved".format(**cache_stats)]
+        lines.append("page cache: {entries}/{capacity} pages, {hits} hits, {misses} misses".format(
+            **cache.page_cache.stats()))
+        scheduler_stats = scheduler.scheduler.stats()
+        lines.append("scheduler: {queue_depth} queued, {in_flight} in flight, "
+                     "rate limit {remaining}/{limit}".format(**scheduler_stats))
+        for name in scheduler.PRIORITY_NAMES.values():
+            lines.append("  {}: {requests} requests, average wait {average_wait:.3f}s, "
+                         "max wait {max_wait:.3f}s".format(name, **scheduler_stats[name]))
+        lines.append("single-flight: {calls} calls, {shared} shared, {in_flight} in flight".format(
+            **singleflight.get_flights.stats()))
+        for executor in (worker.workers, worker.background_workers):
+            lines.append("{name} workers: {workers} threads, {queued} queued, {running} running, "
+                         "{completed} completed, {dropped} dropped, {failed} failed, "
+                         "average run {average_run_time:.3f}s, max run {max_run_time:.3f}s, "
+                         "average queue {average_queue_time:.3f}s".format(**executor.stats()))
+        show_report(self.window, lines)
+        sublime.status_message(lines[1])
+
+
+class ShowGithubIssueMemoryCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        usage = completion.repo_metadata.usage()
+        total = sum(entry[1] for entry in usage)
+        lines = ["GitHub Issue metadata: {} repos, {:.1f}/{:.1f} MB".format(
+            len(usage), total / 1048576.0, completion.repo_metadata.budget / 1048576.0)]
+        for repo, size, issues, labels, commits in usage:
+            lines.append("  {}: {:.1f} MB, {} issues, {} labels, {} commits".format(
+                repo, size / 1048576.0, issues, labels, commits))
+        show_report(self.window, lines)
+        sublime.status_message(lines[0])
+
+
+def show_report(window, lines):
+    '''
+    Show report lines in the plugin output panel of the window.
+    '''
+    panel = window.create_output_panel(REPORT_PANEL)
+    panel.run_command("append", {"characters": LINE_END.join(lines) + LINE_END})
+    window.run_command("show_panel", {"panel": "output." + REPORT_PANEL})
+
+
+REPORT_PANEL = "github_issue"
+
+
 class LoadRepoList:
 
     def __init__(self):
@@ -187,12 +257,28 @@ class LoadRepoList:
 
         self.window.show_quick_panel(self.entries, _param_on_repo_selection)
 
+    def show_panel_then_search(self):
+        _param_on_repo_selection = partial(
+            self.on_repo_selection, subsequent_action=self.ask_search_query)
+        self.window.show_quick_panel(self.entries, _param_on_repo_selection)
+
+    def ask_search_query(self):
+        self.window.show_input_panel('Search issues:', '', self.search_issues, None, None)
+
+    def search_issues(self, query):
+        issue_view = utils.print_list_framework()
+        issue_view.settings().set("search_flag", True)
+        issue_view.set_name("Search: {}".format(query))
+        search = issue.SearchIssues(issue_view, self.username, self.repo_name, query,
+                                    repo_info_storage)
+        search.start()
+
     def on_enter_repo_info(self, content, subsequent_action, **args):
         if '/' in content:
             self.username, self.repo_name = [x.strip()
                                              for x in content.split('/')]
-            log("username is " + str(self.username))
-            log("repo name is " + str(self.repo_name))
+            log("username is {}", self.username)
+            log("repo name is {}", self.repo_name)
             acquire_repo_info = issue.AcquireRepoInfo(self.username,
                                                       self.repo_name)
             acquire_repo_info.start()
@@ -241,8 +327,7 @@ class LoadRepoList:
     def create_issue(self):
         create_new_issue_view()
         view_id = sublime.active_window().active_view().id()
-        utils.restock(repo_info_storage, view_id,
-                      (self.username, self.repo_name, None))
+        repo_info_storage.set(view_id, RepoEntry(self.username, self.repo_name, None))
 
 
 def create_new_issue_view():
@@ -258,6 +343,7 @@ def create_new_issue_view():
     view = sublime.active_window().new_file()
     log("Create new view to write the issue")
     view.run_command("insert_issue_snippet", {"snippet": snippet})
+    utils.get_structure(view).build()
     view.sel().clear()
     start_point = view.text_point(0, 18)
     view.sel().add(sublime.Region(start_point))
@@ -1,11 +1,19 @@
 import sublime
 import sublime_plugin
+import re
+import time
 from . import flag_container as fc
-from . import global_person_list, global_title_list, global_label_list, global_commit_list
-from . import repo_info_storage, issue_obj_storage
-from .libgit.utils import destock, show_stock
-from . import log, settings
-from . import ISSUE_START, ISSUE_END, HEADER_END, CONTENT_END, ADD_COMMENT
+from . import global_person_list
+from .libgit.state import repo_info_storage, issue_obj_storage
+from .libgit.worker import cancel_view
+from .libgit import issue
+from .libgit.completion import repo_metadata
+from .libgit.utils import drop_structure, mark_structure_dirty, IssueStructure
+from .libgit.utils import collapsed_comment_at, load_comment, expand_comment
+from . import log, warn, settings
+from . import marker_table
+
+CURSOR_GUARD_BUDGET = 1
 
 
 def highlight(view, flags_dict):
@@ -30,34 +38,84 @@ def highlight(view, flags_dict):
 #                        new_cursor_position))
 
 
+prefetch_generation = {}
+UNDO_COMMANDS = ("undo", "redo", "soft_undo", "soft_redo", "redo_or_repeat")
+
+
+def selected_issue_numbers(view, extra_rows):
+    row, _ = view.rowcol(view.sel()[0].a)
+    numbers = []
+    for offset in range(extra_rows + 1):
+        line = view.substr(view.line(view.text_point(row + offset, 0)))
+        match_id = re.search(r'^\d+(?=\s)', line)
+        if match_id:
+            numbers.append(int(match_id.group(0)))
+    return numbers
+
+
+def schedule_issue_prefetch(view):
+    '''
+    Prefetch the issues around the cursor once it has rested for a moment.
+    '''
+    view_id = view.id()
+    generation = prefetch_generation.get(view_id, 0) + 1
+    prefetch_generation[view_id] = generation
+
+    def prefetch():
+        if prefetch_generation.get(view_id) != generation:
+            return
+        issue_numbers = selected_issue_numbers(view, settings.get("issue_prefetch_rows", 0))
+        if not issue_numbers:
+            return
+        try:
+            username, repo_name, _ = repo_info_storage[view_id]
+        except KeyError:
+            return
+        issue.PrefetchIssueDetails(view, username, repo_name, issue_numbers).start()
+
+    sublime.set_timeout_async(prefetch, settings.get("issue_prefetch_delay", 300))
+
+
+def expand_collapsed_comment(view, listener):
+    '''
+    Read the collapsed comment under the cursor from the issue store, which
+    may wait on background writers, then expand it on the UI thread.
+    '''
+    comment_id = collapsed_comment_at(view, view.sel()[0].a)
+    if not comment_id:
+        return
+    comment = load_comment(view, comment_id)
+    if comment is None:
+        sublime.status_message("Comment {} is still loading".format(comment_id))
+        return
+
+    def expand():
+        if view.is_valid() and expand_comment(view, comment_id, comment):
+            listener.on_selection_modified(view)
+
+    sublime.set_timeout(expand, 0)
+
+
 class IssueListListener(sublime_plugin.EventListener):
 
     def on_selection_modified(self, view):
         if view.settings().get('issue_flag'):
-            header_flag = False
+            probe = settings.get("cursor_guard_probe", False)
+            if probe:
+                start = time.perf_counter()
             current_point = view.sel()[0].a
-            for header in (ISSUE_START(),
-                           ISSUE_END(),
-                           HEADER_END(),
-                           CONTENT_END(),
-                           ADD_COMMENT()):
-                if view.substr(view.line(current_point)).strip() == header:
-                    header_flag = True
-            header_split = HEADER_END()
-            all_lines = view.lines(sublime.Region(0, view.size()))
-            if len(all_lines) > 7:
-                possible_header = view.lines(sublime.Region(0, view.size()))[:7]
-            else:
-                possible_header = all_lines
+            current_line = view.substr(view.line(current_point)).strip()
+            # collapsed placeholders stay read-only until expanded by the async handler
+            header_flag = current_line in marker_table.get("guard") or (
+                current_line.startswith("*<") and collapsed_comment_at(view, current_point) is not None)
             header_split_line = -1
-            for idx, line in enumerate(possible_header):
-                if view.substr(line) == header_split:
-                    header_split_line = idx
-                    break
+            header_regions = view.get_regions(IssueStructure.key("header_end"))
+            if header_regions:
+                header_split_line = view.rowcol(header_regions[0].a)[0]
             if header_split_line > 0:
-                log("current cursor is located at {}".format(current_point))
+                log("current cursor is located at {}", current_point)
                 row, col = view.rowcol(current_point)
-                log("find the row {} and the col {}".format(row, col))
+                log("find the row {} and the col {}", row, col)
                 if (row < header_split_line and col < 17) or header_flag:
                     if not view.is_read_only():
                         log("set the view read-only")
@@ -68,23 +126,57 @@ class IssueListListener(sublime_plugin.EventListener):
                     if view.is_read_only():
                         log("set the view writable")
                         view.set_read_only(False)
+            if probe:
+                elapsed = (time.perf_counter() - start) * 1000
+                if elapsed > CURSOR_GUARD_BUDGET:
+                    warn("slow cursor guard: {:.3f} ms", elapsed)
+                else:
+                    log("cursor guard took {:.3f} ms", elapsed)
 
     def on_selection_modified_async(self, view):
+        if view.settings().get('issue_flag'):
+            expand_collapsed_comment(view, self)
         if view.settings().get('list_flag'):
             view.add_regions('selected', [view.full_line(view.sel()[0])],
                              "text.issue.list", "dot",
                              sublime.DRAW_SQUIGGLY_UNDERLINE)
+            if settings.get("issue_prefetch", False):
+                schedule_issue_prefetch(view)
+            if settings.get("infinite_scroll", False):
+                issue.schedule_list_scroll(view)
+
+    def on_deactivated_async(self, view):
+        if view.settings().get('issue_flag') and settings.get("spill_hidden_views", False):
+            issue_obj_storage.spill(view.id())
+
+    def on_activated_async(self, view):
+        if view.settings().get('issue_flag') and view.id() in issue_obj_storage:
+            issue_obj_storage.get(view.id())
 
     def on_post_text_command(self, view, command, args):
         if view.settings().get("list_flag"):
             highlight(view, fc.pagination_flags)
+        if view.settings().get("issue_flag") and command in UNDO_COMMANDS:
+            mark_structure_dirty(view)
+
+    def on_modified(self, view):
+        if view.settings().get('issue_flag'):
+            if view.command_history(0, True)[0] == "paste":
+                mark_structure_dirty(view, sublime.get_clipboard())
+            for region in view.sel():
+                # the whole lines under the selection cover dropped and typed text
+                mark_structure_dirty(view, view.substr(view.line(region)))
 
     def on_pre_close(self, view):
+        prefetch_generation.pop(view.id(), None)
+        issue.list_scrolls.pop(view.id(), None)
+        drop_structure(view.id())
         if view.settings().get('issue_flag'):
             try:
                 view_id = view.id()
-                destock(issue_obj_storage, view_id)
-                destock(repo_info_storage, view_id)
+                issue_obj_storage.pop(view_id)
+                repo_info_storage.pop(view_id)
+                cancel_view(view_id)
                 del global_person_list[view_id]
                 log("delete view related issue stock")
             except:
@@ -94,24 +186,21 @@ class IssueListListener(sublime_plugin.EventListener):
         if view.settings().get('issue_flag'):
             pt = locations[0] - len(prefix) - 1
             ch = view.substr(sublime.Region(pt, pt + 1))
-            log("the trigger is {}".format(ch))
+            log("the trigger is {}", ch)
             if view.substr(view.line(locations[0])).startswith(
                     "## Label        :"):
                 log("find label line!")
-                username, repo_name, _ = show_stock(repo_info_storage,
-                                                    view.id())
+                username, repo_name, _ = repo_info_storage[view.id()]
                 repo_info = "{}/{}".format(username, repo_name)
                 if ch == "@" and settings.get("label_completion", True):
                     log("wow, find labels!")
-                    return [[label, label]
-                            for label in global_label_list[repo_info]
-                            if prefix in label]
+                    index = repo_metadata.get(repo_info)
+                    return index.complete_labels(prefix) if index else []
             else:
                 if ch == "@" and settings.get("user_completion", True):
-                    username, repo_name, _ = show_stock(repo_info_storage,
-                                                        view.id())
+                    username, repo_name, _ = repo_info_storage[view.id()]
                     search = prefix.replace("@", "")
-                    log("location is {}".format(str(locations[0])))
+                    log("location is {}", locations[0])
                     results = []
                     try:
                         results = [[key, key]
@@ -124,30 +213,24 @@ class IssueListListener(sublime_plugin.EventListener):
                     else:
                         return results
                 elif ch == "#" and settings.get("issue_title_completion", True):
-                    username, repo_name, _ = show_stock(repo_info_storage,
-                                                        view.id())
+                    username, repo_name, _ = repo_info_storage[view.id()]
                     repo_info = "{}/{}".format(username, repo_name)
                     search = prefix.replace("#", "")
-                    log("title list is {}".format(repr(global_title_list)))
-                    result = [[title, str(number)]
-                              for title, number, state in global_title_list[
-                                  repo_info] if search in title]
-                    log("filtered result is {}".format(repr(result)))
+                    index = repo_metadata.get(repo_info)
+                    result = index.complete_titles(search) if index else []
+                    log("found {} issue titles", len(result))
                     if len(result) > 0:
                         return (result, sublime.INHIBIT_WORD_COMPLETIONS)
                     else:
                         return result
                 elif ch == settings.get("commit_completion_trigger", "&") and settings.get("commit_completion", True):
-                    username, repo_name, _ = show_stock(repo_info_storage,
-                                                        view.id())
+                    username, repo_name, _ = repo_info_storage[view.id()]
                     repo_info = "{}/{}".format(username, repo_name)
                     search = prefix.replace("&", "")
-                    log("commit list is {}".format(repr(global_commit_list)))
-                    if global_commit_list[repo_info]:
-                        result = [[message, ' ' + sha]
-                                  for sha, message in global_commit_list[repo_info]
-                                  if search in message]
-                        log("filtered commit result is {}".format(repr(result)))
+                    index = repo_metadata.get(repo_info)
+                    if index and index.commit_shas:
+                        result = index.complete_commits(search)
+                        log("found {} commits", len(result))
                         if len(result) > 0:
                             return (result, sublime.INHIBIT_WORD_COMPLETIONS)
                         else:
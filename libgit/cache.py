@@ -0,0 +1,220 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import sublime
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from .. import log
+
+KEPT_HEADERS = ("Link", "Content-Type", "ETag", "Last-Modified")
+
+
+class ResponseCache:
+    '''
+    On-disk cache of GET responses, revalidated with ETag/Last-Modified.
+    A 304 answer does not cost GitHub rate limit, so a hit is almost free.
+    '''
+
+    def __init__(self, directory=None, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.loaded = False
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if not self.directory:
+            self.directory = os.path.join(sublime.cache_path(), "GitHubIssue", "http")
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self.entries and self.total_bytes > self.max_bytes:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    @staticmethod
+    def make_key(url, params=None, credential=None):
+        raw = json.dumps([url, sorted((params or {}).items()), str(credential)])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, key):
+        with self.lock:
+            self._load()
+            if key not in self.entries:
+                return None
+            path = os.path.join(self.directory, key)
+            try:
+                with open(path, "rb") as cache_file:
+                    meta = json.loads(cache_file.readline().decode("utf-8"))
+                    meta["body"] = cache_file.read()
+            except (OSError, ValueError):
+                self.total_bytes -= self.entries.pop(key)
+                return None
+            return meta
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get("ETag"):
+            headers["If-None-Match"] = entry["ETag"]
+        if entry.get("Last-Modified"):
+            headers["If-Modified-Since"] = entry["Last-Modified"]
+        return headers
+
+    def miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def store(self, key, response):
+        if "ETag" not in response.headers and "Last-Modified" not in response.headers:
+            return
+        meta = {header: response.headers[header]
+                for header in KEPT_HEADERS if header in response.headers}
+        data = json.dumps(meta).encode("utf-8") + b"\n" + response.content
+        with self.lock:
+            self._load()
+            if len(data) > self.max_bytes:
+                return
+            path = os.path.join(self.directory, key)
+            try:
+                with open(path, "wb") as cache_file:
+                    cache_file.write(data)
+            except OSError:
+                return
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def restore(self, key, entry, not_modified):
+        '''
+        Build a 200 response out of the cached entry and the fresh 304 headers.
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                try:
+                    os.utime(os.path.join(self.directory, key), None)
+                except OSError:
+                    pass
+            self.hits += 1
+            self.bytes_saved += len(entry["body"])
+        response = Response()
+        response.status_code = 200
+        response._content = entry["body"]
+        response.headers = CaseInsensitiveDict(not_modified.headers)
+        for header in KEPT_HEADERS:
+            if header in entry:
+                response.headers[header] = entry[header]
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.encoding = "utf-8"
+        response.from_cache = True
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries),
+                    "bytes": self.total_bytes,
+                    "max_bytes": self.max_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "bytes_saved": self.bytes_saved}
+
+
+class LRUCache:
+    '''
+    Small thread-safe in-memory LRU mapping.
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return default
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.items
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.items.pop(key, default)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.items), "capacity": self.capacity,
+                    "hits": self.hits, "misses": self.misses}
+
+
+http_cache = ResponseCache()
+page_cache = LRUCache(30)
+issue_cache = LRUCache(50)
+
+
+def cached_get(send, credential, url, params=None, **kwargs):
+    '''
+    GET through the shared response cache, sending conditional headers for known URLs.
+    '''
+    if http_cache.max_bytes <= 0:
+        return send(url, params=params, **kwargs)
+    key = ResponseCache.make_key(url, params, credential)
+    entry = http_cache.lookup(key)
+    headers = dict(kwargs.pop("headers", None) or {})
+    if entry:
+        headers.update(http_cache.conditional_headers(entry))
+    response = send(url, params=params, headers=headers, **kwargs)
+    if response.status_code == 304 and entry:
+        log("serve {} from the response cache", url)
+        return http_cache.restore(key, entry, response)
+    http_cache.miss()
+    if response.status_code == 200:
+        http_cache.store(key, response)
+    return response
@@ -0,0 +1,380 @@
+import re
+import sys
+import bisect
+import heapq
+import threading
+from array import array
+from collections import OrderedDict
+from .. import log
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def grams(text):
+    text = text.lower()
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def query_grams(query):
+    query = query.lower()
+    if len(query) < 3:
+        return set([query])
+    return set(query[i:i + 3] for i in range(len(query) - 2))
+
+
+def swapped_grams(query):
+    '''
+    Trigrams of the query with one pair of neighbouring letters swapped.
+    '''
+    query = query.lower()
+    result = set()
+    for i in range(len(query) - 1):
+        result.update(grams(query[:i] + query[i + 1] + query[i] + query[i + 2:]))
+    return result
+
+
+def within_one_edit(a, b):
+    '''
+    True if a and b differ by at most one inserted, deleted or replaced
+    character, or by two swapped neighbours.
+    '''
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < len(a) and i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return (a[i + 1:] == b[i + 1:] or
+                (a[i:i + 1] == b[i + 1:i + 2] and a[i + 1:i + 2] == b[i:i + 1] and a[i + 2:] == b[i + 2:]))
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+
+def near(query, text):
+    '''
+    Every word of the query is one edit away from a word of the text, or
+    from the start of one since the query is still being typed.
+    '''
+    words = WORD.findall(text)
+    return all(any(within_one_edit(wanted, word) or within_one_edit(wanted, word[:len(wanted)])
+                   for word in words)
+               for wanted in WORD.findall(query))
+
+
+def score(text, query, wanted):
+    text = text.lower()
+    position = text.find(query)
+    if position >= 0:
+        result = 100.0 - min(position, 50) * 0.5
+        if position == 0 or not text[position - 1].isalnum():
+            result += 20
+        return result
+    shared = len(wanted.intersection(query_grams_of(text, len(query))))
+    result = 50.0 * shared / len(wanted)
+    if near(query, text):
+        result += 25
+    return result
+
+
+def query_grams_of(text, length):
+    if length < 3:
+        return set(text[i:i + length] for i in range(len(text) - length + 1))
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+FUZZY_CANDIDATES = 200
+
+
+class TextIndex:
+    '''
+    n-gram index over short texts returning the best fuzzy matches.
+    '''
+
+    def __init__(self):
+        self.texts = []
+        self.postings = {}
+
+    def add(self, text):
+        position = len(self.texts)
+        self.texts.append(text)
+        for gram in grams(text):
+            self.postings.setdefault(gram, set()).add(position)
+        return position
+
+    def replace(self, position, text):
+        for gram in grams(self.texts[position]):
+            postings = self.postings.get(gram)
+            if postings:
+                postings.discard(position)
+        self.texts[position] = text
+        for gram in grams(text):
+            self.postings.setdefault(gram, set()).add(position)
+
+    def candidates(self, query, limit):
+        '''
+        Texts sharing most trigrams with the query or one edit away from it.
+        Only the FUZZY_CANDIDATES texts sharing the most trigrams are checked
+        for typos. Queries shorter than a trigram match anywhere in the text.
+        '''
+        wanted = query_grams(query)
+        if len(query) < 3:
+            return wanted, [position for position, text in enumerate(self.texts) if query in text.lower()]
+        postings = sorted((self.postings.get(gram, set()) for gram in wanted), key=len)
+        exact = set.intersection(*postings) if postings else set()
+        if len(exact) >= limit:
+            return wanted, exact
+        counts = {}
+        for gram in wanted:
+            for position in self.postings.get(gram, ()):
+                counts[position] = counts.get(position, 0) + 1
+        if not counts:
+            # swapped letters in a short query can leave no trigram in common
+            for gram in swapped_grams(query):
+                for position in self.postings.get(gram, ()):
+                    counts[position] = counts.get(position, 0) + 1
+        needed = max(1, (len(wanted) + 1) // 2)
+        best = heapq.nlargest(max(FUZZY_CANDIDATES, limit), counts, key=counts.get)
+        return wanted, [position for position in best
+                        if counts[position] >= needed or near(query, self.texts[position].lower())]
+
+    def copy(self):
+        text_index = TextIndex()
+        text_index.texts = self.texts[:]
+        text_index.postings = dict((gram, set(positions)) for gram, positions in self.postings.items())
+        return text_index
+
+    def search(self, query, limit, tie_break=None):
+        query = query.lower()
+        if not query:
+            positions = range(len(self.texts))
+            return heapq.nlargest(limit, positions, key=lambda p: (0, tie_break(p) if tie_break else 0))
+        wanted, positions = self.candidates(query, limit)
+        return heapq.nlargest(limit, positions, key=lambda p: (
+            score(self.texts[p], query, wanted), tie_break(p) if tie_break else 0))
+
+
+class CompletionIndex:
+    '''
+    Prebuilt completion data of one repo: issue titles and numbers, labels
+    and commits (searchable by message or SHA prefix). Columns are kept in
+    arrays next to the text indexes, titles and labels are interned and
+    only the first line of every commit message is stored.
+    '''
+    __slots__ = ("limit", "lock", "title_index", "issue_numbers", "issue_states", "positions",
+                 "numbers", "labels", "label_names", "commit_index", "commit_shas", "shas",
+                 "sha_positions", "size")
+
+    def __init__(self, limit=50):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.title_index = TextIndex()
+        self.issue_numbers = array("l")
+        self.issue_states = bytearray()
+        self.positions = {}
+        self.numbers = []
+        self.labels = TextIndex()
+        self.label_names = set()
+        self.commit_index = TextIndex()
+        self.commit_shas = []
+        self.shas = []
+        self.sha_positions = array("l")
+        self.size = 0
+
+    def update_issues(self, titles):
+        with self.lock:
+            for title, number, state in titles:
+                title = sys.intern(title)
+                position = self.positions.get(number)
+                if position is None:
+                    self.positions[number] = self.title_index.add(title)
+                    self.issue_numbers.append(number)
+                    self.issue_states.append(state)
+                    bisect.insort(self.numbers, str(number))
+                else:
+                    if self.title_index.texts[position] != title:
+                        self.title_index.replace(position, title)
+                    self.issue_states[position] = state
+
+    def update_labels(self, labels):
+        with self.lock:
+            for label in labels:
+                if label not in self.label_names:
+                    label = sys.intern(label)
+                    self.label_names.add(label)
+                    self.labels.add(label)
+
+    def replace_labels(self, labels):
+        '''
+        Swap in the full label list of the repo, dropping deleted labels.
+        '''
+        label_index = TextIndex()
+        label_names = set()
+        for label in labels:
+            if label not in label_names:
+                label = sys.intern(label)
+                label_names.add(label)
+                label_index.add(label)
+        with self.lock:
+            self.labels = label_index
+            self.label_names = label_names
+
+    def known_labels(self):
+        with self.lock:
+            return frozenset(self.label_names)
+
+    def update_commits(self, commits):
+        '''
+        Add the commits not indexed yet. The new commit index is built outside
+        the lock and swapped in, so completions are not held up meanwhile.
+        '''
+        commits = list(commits)
+        while True:
+            with self.lock:
+                commit_index, commit_shas = self.commit_index, self.commit_shas
+                shas, sha_positions = self.shas, self.sha_positions
+            known = set(commit_shas)
+            fresh = []
+            for sha, message in commits:
+                if sha not in known:
+                    known.add(sha)
+                    fresh.append((sha, message))
+            if not fresh:
+                return
+            new_index = commit_index.copy()
+            new_commit_shas = commit_shas[:]
+            pairs = list(zip(shas, sha_positions))
+            for sha, message in fresh:
+                pairs.append((sha, new_index.add(message.strip().split("\n", 1)[0])))
+                new_commit_shas.append(sha)
+            pairs.sort()
+            with self.lock:
+                # another update swapped in first, merge into its result instead
+                if self.commit_index is not commit_index:
+                    continue
+                self.commit_index = new_index
+                self.commit_shas = new_commit_shas
+                self.shas = [sha for sha, _ in pairs]
+                self.sha_positions = array("l", (position for _, position in pairs))
+                return
+
+    def complete_titles(self, search):
+        with self.lock:
+            results = []
+            seen = set()
+            if search.isdigit():
+                start = bisect.bisect_left(self.numbers, search)
+                for text in self.numbers[start:start + self.limit]:
+                    if not text.startswith(search):
+                        break
+                    number = int(text)
+                    results.append([self.title_index.texts[self.positions[number]], text])
+                    seen.add(number)
+            for position in self.title_index.search(search, self.limit, self.issue_order):
+                number = self.issue_numbers[position]
+                if number not in seen:
+                    results.append([self.title_index.texts[position], str(number)])
+            return results[:self.limit]
+
+    def issue_order(self, position):
+        return (-self.issue_states[position], self.issue_numbers[position])
+
+    def complete_labels(self, search):
+        with self.lock:
+            return [[self.labels.texts[position]] * 2
+                    for position in self.labels.search(search, self.limit)]
+
+    def complete_commits(self, search):
+        with self.lock:
+            results = []
+            seen = set()
+            lowered = search.lower()
+            if len(lowered) >= 4 and all(char in "0123456789abcdef" for char in lowered):
+                start = bisect.bisect_left(self.shas, lowered)
+                for index in range(start, min(start + self.limit, len(self.shas))):
+                    sha = self.shas[index]
+                    if not sha.startswith(lowered):
+                        break
+                    position = self.sha_positions[index]
+                    results.append([self.commit_index.texts[position], ' ' + sha])
+                    seen.add(position)
+            for position in self.commit_index.search(search, self.limit):
+                if position not in seen:
+                    results.append([self.commit_index.texts[position], ' ' + self.commit_shas[position]])
+            return results[:self.limit]
+
+    def measure(self):
+        '''
+        Approximate the memory held by this index, in bytes. Only references
+        are copied under the lock, so completions are not held up meanwhile.
+        '''
+        with self.lock:
+            text_indexes = [(text_index.texts[:], text_index.postings, list(text_index.postings.items()))
+                            for text_index in (self.title_index, self.labels, self.commit_index)]
+            columns = (self.issue_numbers, self.issue_states, self.positions, self.numbers,
+                       self.label_names, self.commit_shas, self.shas, self.sha_positions)
+            numbers = self.numbers[:]
+            commit_shas = self.commit_shas[:]
+        size = 0
+        for texts, postings, items in text_indexes:
+            size += sys.getsizeof(texts) + sys.getsizeof(postings)
+            size += sum(sys.getsizeof(text) + 28 for text in texts)
+            for gram, positions in items:
+                size += sys.getsizeof(gram) + sys.getsizeof(positions)
+        size += sum(sys.getsizeof(column) for column in columns)
+        size += sum(sys.getsizeof(text) for text in numbers)
+        size += sum(sys.getsizeof(sha) for sha in commit_shas)
+        self.size = size
+        return size
+
+
+class RepoMetadataCache:
+    '''
+    Completion indexes of the selected repos under a memory budget; the
+    least recently used repos are dropped when the budget is exceeded.
+    '''
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+
+    def get(self, repo):
+        with self.lock:
+            index = self.indexes.get(repo)
+            if index is not None:
+                self.indexes.move_to_end(repo)
+            return index
+
+    def get_or_create(self, repo, limit):
+        with self.lock:
+            index = self.indexes.get(repo)
+            created = index is None
+            if created:
+                index = CompletionIndex(limit)
+                self.indexes[repo] = index
+            self.indexes.move_to_end(repo)
+            return index, created
+
+    def updated(self, repo, budget=None):
+        index = self.get(repo)
+        if index is None:
+            return
+        index.measure()
+        with self.lock:
+            if budget is not None:
+                self.budget = budget
+            total = sum(entry.size for entry in self.indexes.values())
+            for other in list(self.indexes.keys()):
+                if total <= self.budget or other == repo:
+                    break
+                total -= self.indexes.pop(other).size
+                log("evict the metadata of {}", other)
+
+    def usage(self):
+        with self.lock:
+            return [(repo, index.size, len(index.issue_numbers), len(index.label_names),
+                     len(index.commit_shas)) for repo, index in self.indexes.items()]
+
+
+repo_metadata = RepoMetadataCache(64 * 1024 * 1024)
@@ -1,39 +1,108 @@
 import requests
+import requests.adapters
+import threading
 import os
-from .. import log
+from .. import log, span
 import re
+from .cache import http_cache, cached_get
+from .scheduler import scheduler, INTERACTIVE, MUTATION
 
+local_repositories = {}
 git_url = r"^\s*url\s*=\s*(?P<host>(git@|https://)([\w\.@]+)(/|:))(?P<owner>[\w,\-,\_]+)/(?P<repo>[\w,\-,\_,\.]+)((/){0,1})"
 
 
+API_HOST = 'https://api.github.com'
+transports = {}
+transport_lock = threading.Lock()
+
+
+def build_session(api_token, username, password, pool_connections, pool_maxsize):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                            pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    log("The first 8 digits of your GitHub Token is {}", api_token[:8])
+    log("Your own username is {}", username)
+    if api_token:
+        session.headers['Authorization'] = 'token %s' % api_token
+    elif username and password:
+        session.auth = (username, password)
+    else:
+        raise Exception("Please check the authentication settings!")
+    session.headers['content-type'] = 'application/json'
+    return session
+
+
+def get_transport(settings):
+    '''
+    Return the process-wide pooled session for the configured credentials,
+    so every GitRepo reuses the same keep-alive connections.
+    '''
+    key = (API_HOST, settings.get('token', ''), settings.get('username', ''),
+           settings.get('password', ''))
+    with transport_lock:
+        session = transports.get(key)
+        if session is None:
+            session = build_session(key[1], key[2], key[3],
+                                    int(settings.get('pool_connections', 4)),
+                                    int(settings.get('pool_maxsize', 10)))
+            transports[key] = session
+        return session
+
+
+def reset_transports():
+    with transport_lock:
+        for session in transports.values():
+            session.close()
+        transports.clear()
+    log("connection pools closed")
+
+
 class GitHubAccount:
 
     def __init__(self, settings):
-        self.session = requests.Session()
         self.settings = settings
-        api_token = self.settings.get('token', '')
-        log("The first 8 digits of your GitHub Token is {}".format(
-            api_token[:8]))
         self.username = self.settings.get('username', '')
-        log("Your own username is {}".format(self.username))
-        password = self.settings.get('password', '')
-        if api_token:
-            self.session.headers['Authorization'] = 'token %s' % api_token
-        elif self.username and password:
-            self.session.auth = (self.username, password)
-        else:
-            raise Exception("Please check the authentication settings!")
-        self.session.headers['content-type'] = 'application/json'
+        http_cache.resize(int(self.settings.get('http_cache_size', 0)) * 1024 * 1024)
+
+    @property
+    def session(self):
+        return get_transport(self.settings)
+
+    def request(self, method, url, priority=MUTATION, **params):
+        return scheduler.request(
+            lambda: self.send(method, url, **params), priority)
+
+    def send(self, method, url, **params):
+        with span("network"):
+            return self.session.request(method, url, **params)
+
+    def get(self, url, priority=INTERACTIVE, **params):
+        credential = self.session.headers.get('Authorization') or self.session.auth
+        return cached_get(lambda get_url, **get_params: self.request('GET', get_url, priority, **get_params),
+                          credential, url, **params)
+
+    def post(self, url, **params):
+        return self.request('POST', url, **params)
+
+    def patch(self, url, **params):
+        return self.request('PATCH', url, **params)
+
+    def put(self, url, **params):
+        return self.request('PUT', url, **params)
+
+    def delete(self, url, **params):
+        return self.request('DELETE', url, **params)
 
     def join_url(self, username=None, repo_name=None, sequence=None):
-        API_URL = 'https://api.github.com/repos'
+        API_URL = API_HOST + '/repos'
         if not username:
             username = self.username
         if repo_name:
             url = [API_URL, username, repo_name]
             url.extend(sequence)
             joint_url = '/'.join(url)
-            log("the joint url is " + joint_url)
+            log("the joint url is {}", joint_url)
             return joint_url
         else:
             raise Exception("Please check whether the repo_name is correct.")
@@ -52,15 +121,17 @@ def get_github_repo_info(folder_path):
     #     except:
     git_path = get_git_config(folder_path)
     if not git_path:
-        log("folder path {} is not a git repo".format(folder_path))
+        log("folder path {} is not a git repo", folder_path)
         return (-1, -1)
     else:
         if not os.path.isabs(git_path):
-            log("folder path is {}".format(folder_path))
-            log(" git path is {}".format(git_path))
+            log("folder path is {}", folder_path)
+            log(" git path is {}", git_path)
             git_path = os.path.join(folder_path, git_path)
-            log("new git path is {}".format(git_path))
-        return dig_git_file(git_path)
+            log("new git path is {}", git_path)
+        repo_info = dig_git_file(git_path)
+        local_repositories["{}/{}".format(*repo_info)] = os.path.dirname(git_path)
+        return repo_info
 
 
 def get_git_config(folder_path):
@@ -77,8 +148,8 @@ def get_git_config(folder_path):
                     log("git file open")
                     for line in git_file.readlines():
                         if line.decode("utf-8").strip().startswith("gitdir:"):
-                            log("the line is {}".format(line.decode("utf-8")))
-                            log(" gitdir line found! {}".format(line.decode('utf-8').strip()[7:].strip()))
+                            log("the line is {}", line.decode("utf-8"))
+                            log(" gitdir line found! {}", line.decode('utf-8').strip()[7:].strip())
                             return os.path.join(line.decode('utf-8').strip()[7:].strip(), "config")
             except:
                 return
@@ -102,7 +173,7 @@ def dig_git_file(file):
     # repo_name = raw_repo_name.replace("\r", "")
     if repo_name.endswith(".git"):
         repo_name = repo_name[:-4]
-    log("find username {} and repo_name {}".format(username, repo_name))
+    log("find username {} and repo_name {}", username, repo_name)
     return (username, repo_name)
 
 
@@ -1,58 +1,86 @@
 from .github import GitHubAccount
-from .. import log, LINE_END, settings
-from .. import global_person_list, global_title_list, global_label_list, global_commit_list
-from .. import repo_info_storage
-from .utils import get_issue_post, compare_issues, restock, show_stock
-from .utils import format_issue, format_comment, find_comment_region, find_list_region
-from .utils import ViewConverter, configure_issue_view
+from . import github
+from .localgit import read_local_commits
+from .scheduler import scheduler, INTERACTIVE, MUTATION, BACKGROUND
+from .cache import page_cache, issue_cache
+from .store import issue_store
+from .completion import repo_metadata
+from .worker import Job
+from .singleflight import get_flights, flight_key, decode_once
+from .. import log, warn, span, LINE_END, settings
+from .. import global_person_list
+from .state import repo_info_storage, RepoEntry, IssueEntry, list_page
+from .state import snapshot_issue, snapshot_comment, snapshot_issue_entry
+from .utils import get_issue_post, compare_issues
+from .utils import format_issue, insert_comments, clear_new_comment, find_list_region
+from .utils import ViewConverter, configure_issue_view, page_number, get_structure, LIST_END
 from .. import CONTENT_END, ADD_COMMENT
-import threading
 import json
+import time
+import requests
 import random
 import sublime
+from collections import namedtuple
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
 
 
-class AcquireRepoInfo(threading.Thread):
+class AcquireRepoInfo(Job):
+    priority = BACKGROUND
 
     def __init__(self, username, repo_name):
-        super(AcquireRepoInfo, self).__init__(self)
-        self.issue_obj = GitRepo(
-            sublime.load_settings("github_issue.sublime-settings"), username,
-            repo_name)
+        super(AcquireRepoInfo, self).__init__()
+        self.issue_obj = GitRepo(settings, username, repo_name)
+        self.issue_obj.priority = BACKGROUND
 
-    def run(self):
-        title_list = []
-        self.issue_obj.get(params={"state": "all"})
-        if self.issue_obj.github_response.status_code not in (200, 201):
-            raise Exception(
-                "Cannnot find relevant repo info, please check the input!")
-        label_list = self.issue_obj.get_all_labels()
-        while True:
-            for issue in self.issue_obj.github_response.json():
-                title_list.append((issue['title'], issue['number'], 0
-                                   if issue['state'] == 'open' else 1))
-            links = self.issue_obj.get_links()
-            if (not links) or 'next' not in links:
-                break
-            else:
-                self.issue_obj.get(links['next']['url'])
+    def cancel_key(self):
+        return ("acquire", self.issue_obj.username, self.issue_obj.repo_name)
 
-        commit_set = self.issue_obj.get_commits()
-        while True:
-            links = self.issue_obj.get_links()
-            if (not links) or 'next' not in links:
-                break
-            else:
-                commit_set.update(
-                    self.issue_obj.get_commits(links["next"]["url"]))
+    def run(self):
         repo_info = "{}/{}".format(self.issue_obj.username,
                                    self.issue_obj.repo_name)
-        # if repo_info not in global_title_list:
+        index, created = repo_metadata.get_or_create(repo_info, settings.get("completion_limit", 50))
+        if created:
+            index.update_issues(issue_store.titles(repo_info))
+        issue_store.sync(self.issue_obj, lambda page: index.update_issues(
+            [(issue['title'], issue['number'], 0 if issue['state'] == 'open' else 1) for issue in page]),
+            lambda: self.cancelled)
+        if self.cancelled:
+            return
+        label_list = self.issue_obj.get_all_labels()
+        issue_store.save_labels(repo_info, label_list)
+        index.replace_labels(label_list)
+        if self.cancelled:
+            return
+        commit_set = self.get_local_commits(repo_info)
+        if commit_set is None:
+            commit_set = self.get_remote_commits()
+        index.update_commits(commit_set)
+        repo_metadata.updated(repo_info, settings.get("metadata_cache_size", 64) * 1024 * 1024)
         log("finish acquiring label, commit and issue title")
-        global_title_list[repo_info] = sorted(
-            title_list, key=lambda x: (x[2], x[1] * -1))
-        global_label_list[repo_info] = label_list
-        global_commit_list[repo_info] = commit_set
+
+    def get_local_commits(self, repo_info):
+        git_dir = github.local_repositories.get(repo_info)
+        if not git_dir:
+            return None
+        try:
+            commit_set = read_local_commits(git_dir, settings.get("git_path"))
+        except Exception as error:
+            warn("cannot read local commits of {}: {}", repo_info, error)
+            return None
+        log("read {} commits from {}", len(commit_set), git_dir)
+        return commit_set
+
+    def get_remote_commits(self):
+        commit_set = set([])
+        commit_url = self.issue_obj.github_account.join_url(username=self.issue_obj.username,
+                                                            repo_name=self.issue_obj.repo_name,
+                                                            sequence=['commits'])
+        for page in self.issue_obj.get_pages(commit_url, accepted=(200, 409)) or []:
+            for commit in page:
+                commit_set.add((commit['sha'], commit['commit']['message']))
+        return commit_set
 
 
 class GitRepo:
@@ -62,8 +90,8 @@ class GitRepo:
         self.github_account = GitHubAccount(self.settings)
         self.repo_name = repo_name
         self.username = username
-        self.github_response = None
         self.links = None
+        self.priority = INTERACTIVE
 
     def get_repo_info(self, username, repo_name):
         self.username = username
@@ -73,107 +101,223 @@ class GitRepo:
         view_id = view.id()
         try:
             log("try to find the view in repo_dictionary...")
-            log("repo_info_storage contains {}".format(
-                show_stock(repo_info_storage, view_id)))
-            self.username, self.repo_name, self.github_response = show_stock(
-                repo_info_storage, view_id)
+            log("repo_info_storage contains {}", repo_info_storage[view_id])
+            self.username, self.repo_name, self.links = repo_info_storage[view_id]
         except:
             raise Exception("Which repository should I post?")
 
-    def get(self, issue_url=None, **params):
+    def get_page(self, issue_url=None, priority=None, **params):
+        if not issue_url:
+            issue_url = self.github_account.join_url(username=self.username,
+                                                     repo_name=self.repo_name,
+                                                     sequence=['issues'])
+        if priority is None:
+            priority = self.priority
+        return get_flights.do(
+            flight_key("get", issue_url, params),
+            lambda: decode_once(self.github_account.get(issue_url, priority, **params)))
+
+    def get_pages(self, issue_url=None, params=None, per_page=100, max_workers=4, accepted=(200,)):
+        '''
+        Fetch the first page, read the page count from its "last" link and
+        download the remaining pages concurrently. Endpoints without a "last"
+        link are walked sequentially. Returns the decoded pages in page order,
+        or None if the first request fails.
+        '''
         if not issue_url:
             issue_url = self.github_account.join_url(username=self.username,
                                                      repo_name=self.repo_name,
                                                      sequence=['issues'])
-        self.github_response = self.github_account.session.get(issue_url,
-                                                               **params)
-        return self.github_response
+        params = dict(params or {})
+        params["per_page"] = per_page
+        first_page = self.github_account.get(issue_url, self.priority, params=params)
+        if first_page.status_code not in accepted:
+            return None
+        if first_page.status_code != 200:
+            return []
+        links = first_page.links
+        pages = [first_page.json()]
+        if "next" in links and "last" not in links:
+            while "next" in links:
+                response = self.github_account.get(links["next"]["url"], self.priority)
+                if response.status_code != 200:
+                    raise Exception("cannot get {}, error code {}".format(
+                        links["next"]["url"], response.status_code))
+                pages.append(response.json())
+                links = response.links
+        last_page = page_number(links.get("last", {}).get("url"))
+        if last_page > 1:
+            def fetch(number):
+                page_params = dict(params, page=number)
+                response = self.github_account.get(issue_url, self.priority, params=page_params)
+                if response.status_code != 200:
+                    raise Exception("cannot get page {} of {}, error code {}".format(
+                        number, issue_url, response.status_code))
+                return response.json()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pages.extend(executor.map(fetch, range(2, last_page + 1)))
+        log("fetched {} pages of {}", len(pages), issue_url)
+        return pages
+
+    def iter_pages(self, issue_url, params=None, per_page=30, read_ahead=False):
+        '''
+        Yield the decoded pages of a paginated endpoint one at a time. With
+        read_ahead the next page is requested while the caller works on the
+        current one. Only the current page is held in memory.
+        '''
+        params = dict(params or {})
+        params["per_page"] = per_page
+        executor = ThreadPoolExecutor(max_workers=1) if read_ahead else None
+        response = self.github_account.get(issue_url, self.priority, params=params)
+        try:
+            while True:
+                if response.status_code == 409:
+                    return
+                if response.status_code != 200:
+                    raise Exception("cannot get {}, error code {}".format(
+                        issue_url, response.status_code))
+                next_url = response.links.get("next", {}).get("url")
+                page = response.json()
+                response = None
+                pending = None
+                if next_url and executor:
+                    pending = executor.submit(self.github_account.get, next_url, self.priority)
+                yield page
+                if not next_url:
+                    return
+                if pending:
+                    response = pending.result()
+                else:
+                    response = self.github_account.get(next_url, self.priority)
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
+
+    def iter_items(self, sequence, params=None, per_page=30, read_ahead=False):
+        issue_url = self.github_account.join_url(username=self.username,
+                                                 repo_name=self.repo_name,
+                                                 sequence=sequence)
+        for page in self.iter_pages(issue_url, params, per_page, read_ahead):
+            for item in page:
+                yield item
+
+    def iter_comments(self, issue_number, params=None, per_page=30, read_ahead=False):
+        return self.iter_items(['issues', str(issue_number), 'comments'], params, per_page, read_ahead)
 
-    def get_links(self, **params):
-        if not self.github_response:
-            self.get(**params)
-        return self.github_response.links
+    def iter_labels(self, params=None, per_page=30, read_ahead=False):
+        return self.iter_items(['labels'], params, per_page, read_ahead)
 
     def post_issue(self, **params):
         issue_url = self.github_account.join_url(username=self.username, repo_name=self.repo_name, sequence=['issues'])
-        return self.github_account.session.post(issue_url, **params)
+        return self.github_account.post(issue_url, **params)
 
     def update_issue(self, issue_number, **params):
         issue_url = self.github_account.join_url(username=self.username,
                                                  repo_name=self.repo_name,
                                                  sequence=['issues', str(issue_number)])
-        return self.github_account.session.patch(issue_url, **params)
+        return self.github_account.patch(issue_url, **params)
 
     def post_comment(self, issue_number, **params):
         issue_url = self.github_account.join_url(username=self.username,
                                                  repo_name=self.repo_name,
                                                  sequence=['issues', str(issue_number), 'comments'])
-        return self.github_account.session.post(issue_url, **params)
+        return self.github_account.post(issue_url, **params)
 
     def update_comment(self, comment_id, **params):
         issue_url = self.github_account.join_url(username=self.username,
                                                  repo_name=self.repo_name,
                                                  sequence=['issues', 'comments', str(comment_id)])
-        return self.github_account.session.patch(issue_url, **params)
+        return self.github_account.patch(issue_url, **params)
 
     def delete_comment(self, comment_id, **params):
         issue_url = self.github_account.join_url(username=self.username,
                                                  repo_name=self.repo_name,
                                                  sequence=['issues', 'comments', str(comment_id)])
-        return self.github_account.session.delete(issue_url, **params)
-
-    def get_issue_comment(self, issue_number, **params):
-        issue_url = self.github_account.join_url(username=self.username,
-                                                 repo_name=self.repo_name,
-                                                 sequence=['issues', str(issue_number)])
+        return self.github_account.delete(issue_url, **params)
+
+    def issue_comment_key(self, issue_number, **params):
+        return flight_key("issue_comment", self.username, self.repo_name, issue_number, params)
+
+    def get_issue(self, issue_number):
+        return self.get_page(self.github_account.join_url(username=self.username,
+                                                          repo_name=self.repo_name,
+                                                          sequence=['issues', str(issue_number)]))
+
+    def iter_comment_pages(self, issue_number, per_page=100):
+        '''
+        Yield the decoded comment pages of an issue, requesting the next page
+        while the caller works on the current one. Every page goes through
+        get_page, so views reading the same issue share each download.
+        '''
         comment_url = self.github_account.join_url(username=self.username,
                                                    repo_name=self.repo_name,
                                                    sequence=['issues', str(issue_number), 'comments'])
-        return (
-            self.github_account.session.get(issue_url, **params),
-            self.github_account.session.get(comment_url, **params))
-
-    def get_commits(self, issue_url=None):
-        if not issue_url:
-            issue_url = self.github_account.join_url(username=self.username,
-                                                     repo_name=self.repo_name,
-                                                     sequence=['commits'])
-        commit_set = set([])
-        commit_resp = self.get(issue_url)
-        if commit_resp.status_code == 200:
-            for commit in commit_resp.json():
-                commit_set.add((commit['sha'], commit['commit']['message']))
-            return commit_set
-        elif commit_resp.status_code == 409:
-            pass
-        else:
-            raise Exception("cannot get commits!, error code {}".format(commit_resp.status_code))
+        executor = ThreadPoolExecutor(max_workers=1)
+        response = self.get_page(comment_url, params={"per_page": per_page})
+        try:
+            while True:
+                if response.status_code != 200:
+                    raise Exception("cannot get {}, error code {}".format(
+                        comment_url, response.status_code))
+                next_url = response.links.get("next", {}).get("url")
+                page = response.json()
+                response = None
+                pending = executor.submit(self.get_page, next_url) if next_url else None
+                yield page
+                if not pending:
+                    return
+                response = pending.result()
+        finally:
+            executor.shutdown(wait=False)
+
+    def fetch_issue_comment(self, issue_number):
+        '''
+        Get the issue and an iterator over its comment pages. Each comment
+        page is requested as the caller walks the iterator.
+        '''
+        issue_response = self.get_issue(issue_number)
+        if issue_response.status_code not in (200, 201) or not issue_response.json().get('comments'):
+            return (issue_response, iter(()))
+        return (issue_response, self.iter_comment_pages(issue_number))
 
     def replace_labels(self, issue_number, labels):
         issue_url = self.github_account.join_url(username=self.username,
                                                  repo_name=self.repo_name,
                                                  sequence=['issues', str(issue_number), 'labels'])
-        log("replace label url is {}".format(issue_url))
+        log("replace label url is {}", issue_url)
         if len(labels) == 1 and '' in labels:
-            return self.github_account.session.delete(issue_url)
-        return self.github_account.session.put(issue_url, json=list(labels))
+            return self.github_account.delete(issue_url)
+        return self.github_account.put(issue_url, json=list(labels))
 
     def get_all_labels(self):
-        issue_url = self.github_account.join_url(username=self.username, repo_name=self.repo_name, sequence=['labels'])
         labels = set([])
-        label_resp = self.github_account.session.get(issue_url)
-        if label_resp.status_code != 200:
-            raise Exception("cannot get labels")
-        for label in label_resp.json():
+        for label in self.iter_labels(per_page=100, read_ahead=True):
             labels.add(label['name'])
         return labels
 
     def attach_labels(self, issue_number, labels):
-        all_labels = self.get_all_labels()
-        new_labels = set(labels).difference(all_labels)
-        if len(new_labels) > 0:
-            self.generate_labels(new_labels)
-        self.replace_labels(issue_number, labels)
+        self.create_missing_labels(labels)
+        return self.replace_labels(issue_number, labels)
+
+    def create_missing_labels(self, labels):
+        '''
+        Create the labels the repo does not have yet, judged by the labels
+        held for completion or in the local store instead of listing them
+        again. Without known labels GitHub creates missing labels itself when
+        they are attached.
+        '''
+        repo = "{}/{}".format(self.username, self.repo_name)
+        index = repo_metadata.get(repo)
+        known = index.known_labels() if index is not None else frozenset()
+        if not known:
+            known = issue_store.labels(repo)
+        new_labels = set(labels).difference(known)
+        if not known or not new_labels:
+            return
+        self.generate_labels(new_labels)
+        issue_store.save_labels(repo, known.union(new_labels))
+        if index is not None:
+            index.update_labels(new_labels)
 
     def generate_labels(self, labels):
         issue_url = self.github_account.join_url(username=self.username,
@@ -181,16 +325,18 @@ class GitRepo:
                                                  sequence=["labels"])
         for label in labels:
             color = "%06x" % random.randint(0, 0xFFFFFF)
-            label_resp = self.github_account.session.post(
+            label_resp = self.github_account.post(
                 issue_url, json={"color": color,
                                  "name": label})
-            log("the generate labels code is {}".format(
-                label_resp.status_code))
-            if label_resp.status_code != 201:
+            log("the generate labels code is {}", label_resp.status_code)
+            if label_resp.status_code == 422:
+                log("label {} already exists", label)
+            elif label_resp.status_code != 201:
                 raise Exception("error creating label {}".format(label))
 
 
-class PrintListInView(threading.Thread):
+class PrintListInView(Job):
+    channel = "list"
 
     def __init__(self,
                  view,
@@ -199,59 +345,314 @@ class PrintListInView(threading.Thread):
                  command=None,
                  new_flag=True,
                  **args):
-        super(PrintListInView, self).__init__(self)
+        super(PrintListInView, self).__init__()
         self.issue_list = issue_list
         self.args = args
         self.repo_info_storage = repo_info_storage
         self.view = view
         self.command = command
         self.new_flag = new_flag
+        if settings.get("infinite_scroll", False):
+            self.args.setdefault("per_page", 100)
 
     def run(self):
+        username, repo_name = self.issue_list.username, self.issue_list.repo_name
+        page_url = None
         if not self.new_flag:
-            if not self.issue_list.github_response:
-                self.issue_list.get(params=self.args)
-            else:
-                _, _, self.issue_list.github_response = show_stock(
-                    self.repo_info_storage, self.view.id())
-                if self.command:
-                    links = self.issue_list.get_links()
-                    if self.command in links:
-                        self.issue_list.get(links[self.command]['url'],
-                                            params=self.args)
-                    else:
-                        pass
-        else:
-            self.issue_list.get(params=self.args)
-        github_response = self.issue_list.github_response
+            # page from the list view's own entry, the shared GitRepo may belong to another view
+            entry = self.repo_info_storage.get(self.view.id())
+            if entry is None:
+                return
+            username, repo_name, links = entry
+            if self.command:
+                if not links or self.command not in links:
+                    return
+                page_url = links[self.command]
+        filters = list_filters(self.args, page_url)
+        key = list_page_key(username, repo_name, self.args, page_url)
+        repo = "{}/{}".format(username, repo_name)
+        rendered = None
+        cached_page = page_cache.get(key)
+        if cached_page is not None:
+            log("render page {} from the page cache", key[3])
+            rendered = cached_page.issues
+        elif STORE_FILTERS.issuperset(filters):
+            rendered = issue_store.list_issues(repo, filters.get("state", "open"), key[3],
+                                               int(filters.get("per_page", 30))) or None
+        if self.cancelled:
+            return
+        if rendered is not None:
+            self.render(rendered)
+        try:
+            # a page url already carries the filters of the list
+            github_response = self.issue_list.get_page(page_url, params=None if page_url else self.args)
+        except requests.exceptions.ConnectionError:
+            if rendered is None:
+                raise
+            if self.view.id() not in self.repo_info_storage:
+                self.repo_info_storage.set(self.view.id(), RepoEntry(username, repo_name, None))
+            sublime.status_message("GitHub is unreachable, showing stored issues")
+            return
+        if self.cancelled:
+            log("drop the stale issue list page")
+            return
         if github_response.status_code in (200, 201):
-            json_list = github_response.json()
-            snippet = '\n'
-            for issue in json_list:
-                snippet += "{:<12}{:<10}{}".format(
-                    str(issue['number']), issue['locked'],
-                    issue['title']) + LINE_END
-            start_point, end_point = find_list_region(self.view)
-            if self.view.is_read_only():
-                self.view.set_read_only(False)
-            self.view.run_command("replace_snippet", {"snippet": snippet,
-                                                      "start_point":
-                                                      start_point,
-                                                      "end_point": end_point})
-            self.view.sel().clear()
-            view_converter = ViewConverter(self.view)
-            start = view_converter.get_line_regions()[3].a
-            self.view.sel().add(sublime.Region(start, start))
-            self.view.set_read_only(True)
-            restock(self.repo_info_storage, self.view.id(),
-                    (self.issue_list.username, self.issue_list.repo_name,
-                     github_response))
-        else:
+            page = list_page(github_response)
+            page_cache.put(key, page)
+            issue_store.save_issues(repo, page.issues)
+            if rendered != page.issues:
+                self.render(page.issues)
+            self.repo_info_storage.set(self.view.id(), RepoEntry(username, repo_name, page.links))
+            if settings.get("infinite_scroll", False):
+                list_scrolls[self.view.id()] = ListScroll(self.args, page.issues, page.links.get("next"))
+            self.prefetch(username, repo_name, page.links)
+        elif rendered is None:
             sublime.status_message("Cannot obtain issue list, error code {}".
                                    format(str(github_response.status_code)))
 
+    def render(self, json_list):
+        with span("render"):
+            print_issue_rows(self.view, json_list)
+
+    def prefetch(self, username, repo_name, links):
+        for relation in ("next", "prev"):
+            if relation in links:
+                page_url = links[relation]
+                key = list_page_key(username, repo_name, self.args, page_url)
+                if key not in page_cache:
+                    PrefetchListPage(self.view, self.issue_list, key, page_url, relation).start()
+
+
+def format_issue_row(issue):
+    return "{:<12}{:<10}{}".format(str(issue['number']), issue['locked'], issue['title']) + LINE_END
+
+
+# the list filters the issue store can answer by itself
+STORE_FILTERS = frozenset(("state", "per_page"))
+
+
+def print_issue_rows(view, json_list):
+    snippet = '\n'
+    for issue in json_list:
+        snippet += format_issue_row(issue)
+    start_point, end_point = find_list_region(view)
+    if view.is_read_only():
+        view.set_read_only(False)
+    view.run_command("replace_snippet", {"snippet": snippet,
+                                         "start_point":
+                                         start_point,
+                                         "end_point": end_point})
+    view.sel().clear()
+    view_converter = ViewConverter(view)
+    start = view_converter.get_line_regions()[3].a
+    view.sel().add(sublime.Region(start, start))
+    view.set_read_only(True)
+
+
+def append_issue_rows(view, json_list, limit):
+    '''
+    Add rows at the bottom of the list, then drop the oldest rows at the top
+    so that at most limit rows stay in the view.
+    '''
+    start_point, end_point = find_list_region(view)
+    if view.is_read_only():
+        view.set_read_only(False)
+    view.run_command("insert_issue_snippet", {"snippet": "".join(format_issue_row(issue) for issue in json_list),
+                                              "start_point": end_point})
+    _, end_point = find_list_region(view)
+    first_row = view.rowcol(start_point)[0] + 1
+    extra = view.rowcol(end_point)[0] - first_row - limit
+    if extra > 0:
+        view.run_command("erase_snippet", {"start_point": view.text_point(first_row, 0),
+                                           "end_point": view.text_point(first_row + extra, 0)})
+        log("trim {} rows from the issue list", extra)
+    view.set_read_only(True)
+
+
+class ListScroll:
+    '''
+    Infinite scroll state of a list view: the url of the next page and the
+    issues already shown, since issues move between pages while scrolling.
+    '''
+
+    def __init__(self, args, json_list, next_url):
+        self.args = args
+        self.next_url = next_url
+        self.seen = set(issue['number'] for issue in json_list)
+        self.handle = None
+
+    def loading(self):
+        return self.handle is not None and not self.handle.done.is_set()
+
+    def add(self, json_list):
+        fresh = [issue for issue in json_list if issue['number'] not in self.seen]
+        self.seen.update(issue['number'] for issue in fresh)
+        return fresh
+
+
+list_scrolls = {}
+SCROLL_MARGIN = 10
+
+
+def schedule_list_scroll(view):
+    '''
+    Load the next page of an infinite scroll list once the cursor gets within
+    SCROLL_MARGIN rows of its last row.
+    '''
+    scroll = list_scrolls.get(view.id())
+    if scroll is None or not scroll.next_url or scroll.loading():
+        return
+    end = view.find(LIST_END, 0, sublime.LITERAL)
+    if end.a < 0 or view.rowcol(end.a)[0] - view.rowcol(view.sel()[0].a)[0] > SCROLL_MARGIN:
+        return
+    try:
+        username, repo_name, _ = repo_info_storage[view.id()]
+    except KeyError:
+        return
+    scroll.handle = AppendListPage(view, username, repo_name, scroll).start()
+
+
+class AppendListPage(Job):
+    channel = "scroll"
+
+    def __init__(self, view, username, repo_name, scroll):
+        super(AppendListPage, self).__init__()
+        self.view = view
+        self.issue_obj = GitRepo(settings, username, repo_name)
+        self.scroll = scroll
+
+    def run(self):
+        if not self.scroll.next_url:
+            return
+        username, repo_name = self.issue_obj.username, self.issue_obj.repo_name
+        key = list_page_key(username, repo_name, self.scroll.args, self.scroll.next_url)
+        page = page_cache.get(key)
+        if page is None:
+            github_response = self.issue_obj.get_page(self.scroll.next_url)
+            if github_response.status_code != 200:
+                if not self.cancelled:
+                    sublime.status_message("Cannot obtain issue list, error code {}".
+                                           format(str(github_response.status_code)))
+                return
+            page = list_page(github_response)
+            page_cache.put(key, page)
+        if self.cancelled or list_scrolls.get(self.view.id()) is not self.scroll:
+            return
+        issue_store.save_issues("{}/{}".format(username, repo_name), page.issues)
+        fresh = self.scroll.add(page.issues)
+        self.scroll.next_url = page.links.get("next")
+        with span("render"):
+            append_issue_rows(self.view, fresh, settings.get("infinite_scroll_rows", 1000))
+        log("append {} issues, {} duplicates dropped", len(fresh), len(page.issues) - len(fresh))
+        if self.scroll.next_url:
+            key = list_page_key(username, repo_name, self.scroll.args, self.scroll.next_url)
+            if key not in page_cache:
+                PrefetchListPage(self.view, self.issue_obj, key, self.scroll.next_url, "next").start()
+
+
+class SearchIssues(Job):
+    channel = "list"
+
+    def __init__(self, view, username, repo_name, query, repo_info_storage):
+        super(SearchIssues, self).__init__()
+        self.view = view
+        self.username = username
+        self.repo_name = repo_name
+        self.query = query
+        self.repo_info_storage = repo_info_storage
+
+    def run(self):
+        start = time.time()
+        hits = issue_store.search("{}/{}".format(self.username, self.repo_name), self.query,
+                                  settings.get("search_result_limit", 100))
+        log("search for {} found {} issues in {:.3f}s", self.query, len(hits), time.time() - start)
+        if self.cancelled:
+            return
+        self.repo_info_storage.set(self.view.id(), RepoEntry(self.username, self.repo_name, None))
+        with span("render"):
+            print_issue_rows(self.view, hits)
+        sublime.status_message("{} issues match \"{}\"".format(len(hits), self.query))
+
+
+class PrefetchListPage(Job):
+    priority = BACKGROUND
+
+    def __init__(self, view, issue_list, key, page_url, relation):
+        super(PrefetchListPage, self).__init__()
+        self.view = view
+        self.issue_list = issue_list
+        self.key = key
+        self.page_url = page_url
+        self.channel = "prefetch-" + relation
 
-class PrintIssueInView(threading.Thread):
+    def run(self):
+        if not scheduler.can_spend(BACKGROUND):
+            return
+        github_response = self.issue_list.get_page(self.page_url, BACKGROUND)
+        if github_response.status_code == 200 and not self.cancelled:
+            page_cache.put(self.key, list_page(github_response))
+            log("prefetched page {}", self.key[3])
+
+
+def list_filters(args, page_url=None):
+    '''
+    Filters of a list page: the query of its url without the page number,
+    or the arguments of the list for its first page.
+    '''
+    if page_url:
+        return dict((name, values[-1]) for name, values in parse_qs(urlparse(page_url).query).items()
+                    if name != "page")
+    return dict((name, str(value)) for name, value in args.items())
+
+
+def list_page_key(username, repo_name, args, page_url=None):
+    return (username, repo_name, flight_key(list_filters(args, page_url)), page_number(page_url))
+
+
+class PrefetchIssueDetails(Job):
+    '''
+    Warm the issue cache for the rows under the cursor of a list view.
+    '''
+    priority = BACKGROUND
+    channel = "prefetch-issue"
+
+    def __init__(self, view, username, repo_name, issue_numbers):
+        super(PrefetchIssueDetails, self).__init__()
+        self.view = view
+        self.issue_obj = GitRepo(settings, username, repo_name)
+        self.issue_obj.priority = BACKGROUND
+        self.issue_numbers = issue_numbers
+
+    def run(self):
+        for issue_number in self.issue_numbers:
+            if self.cancelled or not scheduler.can_spend(BACKGROUND):
+                return
+            key = (self.issue_obj.username, self.issue_obj.repo_name, issue_number)
+            prefetched = issue_cache.get(key)
+            if prefetched and time.time() - prefetched[0] < ISSUE_CACHE_AGE:
+                continue
+            get_flights.do(self.issue_obj.issue_comment_key(issue_number),
+                           lambda: self.prefetch(key, issue_number))
+
+    def prefetch(self, key, issue_number):
+        github_response, pages = self.issue_obj.fetch_issue_comment(issue_number)
+        if github_response.status_code != 200:
+            return
+        comments = []
+        for page in pages:
+            if self.cancelled or not scheduler.can_spend(BACKGROUND):
+                return
+            comments.extend(page)
+        issue_cache.put(key, (time.time(), github_response.json(), comments))
+        log("prefetched issue {}", issue_number)
+
+
+ISSUE_CACHE_AGE = 120
+RECENT_COMMENTS = 20
+
+
+class PrintIssueInView(Job):
+    channel = "issue"
 
     def __init__(self,
                  issue_list,
@@ -260,64 +661,180 @@ class PrintIssueInView(threading.Thread):
                  repo_info,
                  repo_info_storage,
                  view=None):
-        super(PrintIssueInView, self).__init__(self)
+        super(PrintIssueInView, self).__init__()
         self.issue_list = issue_list
         self.issue_number = issue_number
         self.issue_storage = issue_storage
         self.repo_info = repo_info
         self.repo_info_storage = repo_info_storage
         self.view = view
+        self.started = time.time()
 
     def run(self):
-        github_response, comments_response = self.issue_list.get_issue_comment(
-            self.issue_number)
-        if github_response.status_code in (200, 201):
-            issue = github_response.json()
-            comments = comments_response.json()
-            user_set = set([])
-            label_set = set([])
-            for label_info in issue['labels']:
-                label_set.add(label_info['name'])
-            user_set.add(issue['user']['login'])
-            snippet = ''
-            snippet += format_issue(issue)
-            comment_dict = {}
-            for comment in comments:
-                user_set.add(comment['user']['login'])
-                comment_dict[comment['id']] = comment
-                snippet += format_comment(comment)
-            snippet += ADD_COMMENT() + LINE_END
-            snippet += LINE_END
-            snippet += CONTENT_END()
+        self.started = time.time()
+        repo = "{}/{}".format(self.repo_info[0], self.repo_info[1])
+        stored = issue_store.get_issue(repo, self.issue_number)
+        if stored and stored[0].get('comments') != len(stored[1]):
+            stored = None
+        change_count = None
+        if stored:
+            log("render issue {} from the issue store", self.issue_number)
+            self.render(stored[0], stored[1])
+            change_count = self.view.change_count()
+        flight = self.issue_list.issue_comment_key(self.issue_number)
+        if get_flights.running(flight):
+            log("wait for the prefetch of issue {}", self.issue_number)
+            try:
+                get_flights.do(flight, lambda: None)
+            except Exception as error:
+                log("the prefetch of issue {} failed: {}", self.issue_number, error)
+        prefetched = issue_cache.pop(
+            (self.repo_info[0], self.repo_info[1], self.issue_number))
+        if prefetched and time.time() - prefetched[0] < ISSUE_CACHE_AGE:
+            log("render issue {} from the prefetch cache", self.issue_number)
+            _, issue, comments = prefetched
+            issue_store.save_issues(repo, [issue])
+            issue_store.save_comments(repo, self.issue_number, comments)
+        elif not stored:
+            self.stream(repo)
+            return
+        else:
+            try:
+                fetched = self.fetch(repo)
+            except requests.exceptions.ConnectionError:
+                sublime.status_message("GitHub is unreachable, showing the stored issue")
+                return
+            if fetched is None:
+                return
+            issue, comments = fetched
+        if self.cancelled:
+            log("drop the stale issue {}", self.issue_number)
+            return
+        if not stored:
+            self.render(issue, comments)
+        elif issue_signature(stored[0], stored[1]) != issue_signature(issue, comments):
+            if self.view.change_count() == change_count:
+                self.render(issue, comments)
+            else:
+                sublime.status_message("Issue {} changed on GitHub, reopen it to see the update".format(
+                    self.issue_number))
+        else:
+            self.issue_storage.set(self.view.id(), snapshot_issue_entry(issue, comments))
+
+    def fetch(self, repo):
+        '''
+        Get the issue and walk its comment pages, saving each page to the
+        issue store as it arrives. Returns None if the issue cannot be read
+        or the job is cancelled.
+        '''
+        github_response, pages = self.issue_list.fetch_issue_comment(self.issue_number)
+        if github_response.status_code not in (200, 201):
+            return None
+        issue = github_response.json()
+        issue_store.save_issues(repo, [issue])
+        comments = []
+        for page in pages:
+            if self.cancelled:
+                log("drop the rest of issue {}", self.issue_number)
+                return None
+            issue_store.save_comments(repo, self.issue_number, page, complete=not comments)
+            comments.extend(page)
+        if not comments:
+            issue_store.save_comments(repo, self.issue_number, comments)
+        return issue, comments
+
+    def stream(self, repo):
+        '''
+        Paint the issue as soon as it arrives, then append the comments one
+        page at a time above the new comment area.
+        '''
+        github_response = self.issue_list.get_issue(self.issue_number)
+        if self.cancelled or github_response.status_code not in (200, 201):
+            return
+        issue = github_response.json()
+        issue_store.save_issues(repo, [issue])
+        self.paint(issue)
+        comments = []
+        size = 0
+        if not issue.get('comments'):
+            issue_store.save_comments(repo, self.issue_number, comments)
+            return
+        for page in self.issue_list.iter_comment_pages(self.issue_number):
+            if self.cancelled:
+                log("drop the rest of issue {}", self.issue_number)
+                return
+            # saved page by page so that collapsed comments can be expanded right away
+            issue_store.save_comments(repo, self.issue_number, page, complete=not comments)
+            size += sum(len(comment['body']) for comment in page)
+            collapsed = collapse_comments(page, len(comments), issue['comments'], size)
+            comments.extend(page)
+            self.append_comments(issue, comments, page, collapsed)
+
+    def render(self, issue, comments):
+        self.paint(issue)
+        size = sum(len(comment['body']) for comment in comments)
+        self.append_comments(issue, comments, comments,
+                             collapse_comments(comments, 0, len(comments), size))
+
+    def paint(self, issue):
+        with span("render"):
+            snippet = "".join([format_issue(issue), ADD_COMMENT(), LINE_END, LINE_END, CONTENT_END()])
             if not self.view:
-                self.view = sublime.active_window().new_file()
-            global_person_list[self.view.id()] = user_set
-            log("person list is {}".format(
-                str(global_person_list)))
-            restock(self.issue_storage, self.view.id(), {"issue": issue,
-                                                         "label": label_set,
-                                                         "comments":
-                                                         comment_dict})
-            restock(self.repo_info_storage, self.view.id(),
-                    (self.repo_info[0], self.repo_info[1], github_response))
+                self.bind_view(sublime.active_window().new_file())
+            global_person_list[self.view.id()] = set([issue['user']['login']])
+            self.issue_storage.set(self.view.id(), snapshot_issue_entry(issue, []))
+            self.repo_info_storage.set(self.view.id(), RepoEntry(self.repo_info[0], self.repo_info[1], None))
             self.view.run_command("erase_snippet",
                                   {"start_point": 0,
                                    "end_point": self.view.size()})
             self.view.run_command("insert_issue_snippet", {"snippet": snippet})
-            view_converter = ViewConverter(self.view)
-            _, a, b, _ = view_converter.find_region_line(ADD_COMMENT(), CONTENT_END())
+            markers = get_structure(self.view).markers()
+            a, b = markers['add_comment'][0].b, markers['content_end'][0].a
             self.view.sel().clear()
             if b > a:
                 self.view.sel().add(sublime.Region(a + 1, a + 1))
             else:
                 self.view.sel().add(sublime.Region(a, a))
             configure_issue_view(self.view)
-
-
-class IssueManipulate(threading.Thread):
+        log("issue {} painted {:.0f} ms after the request", self.issue_number,
+            (time.time() - self.started) * 1000)
+
+    def append_comments(self, issue, comments, chunk, collapsed=()):
+        '''
+        Insert a chunk of comments above ADD NEW COMMENT and index their
+        markers without rescanning the view.
+        '''
+        if not chunk:
+            return
+        with span("render"):
+            insert_comments(self.view, chunk, collapsed)
+            global_person_list[self.view.id()].update(comment['user']['login'] for comment in chunk)
+            self.issue_storage.set(self.view.id(), snapshot_issue_entry(issue, comments))
+
+
+def collapse_comments(comments, offset, total, size):
+    '''
+    Ids of the comments to render collapsed. An issue with more than
+    "large_issue_comments" comments or "large_issue_size" bytes of comments
+    is shown with only its last RECENT_COMMENTS comments expanded.
+    '''
+    most_comments = settings.get("large_issue_comments", 300)
+    most_size = settings.get("large_issue_size", 512 * 1024)
+    if not (most_comments and total > most_comments) and not (most_size and size > most_size):
+        return set()
+    return set(comment['id'] for index, comment in enumerate(comments, offset)
+               if index < total - RECENT_COMMENTS)
+
+
+def issue_signature(issue, comments):
+    return (issue['updated_at'], [(comment['id'], comment['updated_at']) for comment in comments])
+
+
+class IssueManipulate(Job):
+    priority = MUTATION
 
     def __init__(self, view=None, issue_storage=None, issue_list=None):
-        super(IssueManipulate, self).__init__(self)
+        super(IssueManipulate, self).__init__()
         if not view:
             self.view = sublime.active_window().active_view()
         else:
@@ -330,129 +847,152 @@ class PostNewIssue(IssueManipulate):
 
     def run(self):
         issue_post = get_issue_post(self.view)
-        log("preparing posting issue " + str(issue_post[
-            'issue']))
-        post_result = self.issue_list.post_issue(
-            data=json.dumps(issue_post['issue']))
+        log("preparing posting issue {}", issue_post['issue'])
+        data = issue_post['issue']
+        if issue_post['label']:
+            self.issue_list.create_missing_labels(issue_post['label'])
+            data = dict(data, labels=sorted(issue_post['label']))
+        post_result = self.issue_list.post_issue(data=json.dumps(data))
         if post_result.status_code in (200, 201):
             issue = post_result.json()
-            if len(issue_post['label']) != 0:
-                self.issue_list.attach_labels(issue['number'],
-                                              issue_post['label'])
+            repo = "{}/{}".format(self.issue_list.username, self.issue_list.repo_name)
+            issue_store.save_issues(repo, [issue])
             repo_info = (self.issue_list.username, self.issue_list.repo_name,
                          None)
             self.view.settings().set("new_issue", False)
-            print_issue_in_view = PrintIssueInView(
-                self.issue_list, issue['number'], self.issue_storage,
-                repo_info, repo_info_storage, self.view)
-            print_issue_in_view.start()
+            PrintIssueInView(self.issue_list, issue['number'], self.issue_storage,
+                             repo_info, repo_info_storage, self.view).render(issue, [])
         else:
             sublime.status_message(
                 "Issue not Posted, error code {} please try again.".format(
                     str(post_result.status_code)))
 
 
+Mutation = namedtuple("Mutation", ["kind", "target", "send"])
+MUTATION_WORKERS = 4
+
+
+def send_mutation(mutation):
+    '''
+    Send one planned request; a failure is returned so that it does not hide
+    the responses of the other requests.
+    '''
+    try:
+        return mutation.send(), None
+    except Exception as error:
+        return None, error
+
+
 class UpdateIssue(IssueManipulate):
+    '''
+    Send the changes of an issue view with as few round trips as possible:
+    labels travel in the issue PATCH and all requests are independent, so
+    they are sent together. Responses are applied in plan order, which keeps
+    the annotations at the end of the view in a stable order.
+    '''
 
     def run(self):
         view_id = self.view.id()
-        original_issue = show_stock(self.issue_storage, view_id)
-        if original_issue:
-            log("successfully take out original issue")
-        log("take out original issue with title {}".format(
-            original_issue['issue']['title']))
-        last_updated_time = original_issue['issue']['updated_at']
+        original_issue = self.issue_storage[view_id]
+        log("take out original issue with title {}", original_issue.issue['title'])
+        self.issue = original_issue.issue
+        self.label_set = original_issue.label
+        self.comments = dict(original_issue.comments)
+        self.repo = "{}/{}".format(self.issue_list.username, self.issue_list.repo_name)
         modified_issue = get_issue_post(self.view)
         log("get the modified issue")
-        issue_change, label_change, comment_change, deleted_comments = compare_issues(
-            original_issue, modified_issue)
-        if issue_change:
-            updating_issue = self.issue_list.update_issue(
-                original_issue['issue']['number'],
-                data=json.dumps(issue_change))
-            if updating_issue.status_code in (200, 201):
-                sublime.status_message("Issue updated")
-                original_issue['issue'] = updating_issue.json()
-                if updating_issue.json()['updated_at'] != last_updated_time:
-                    self.view.run_command(
-                        "insert_issue_snippet",
-                        {"start_point": self.view.size(),
-                         "snippet":
-                         "\n*<Issue number {} updated at {}>*".format(
-                             str(updating_issue.json()['id']),
-                             updating_issue.json()['updated_at'])})
-            else:
-                sublime.status_message("Issue update fails")
-                log("issue update fails, error code " + str(
-                    updating_issue.status_code))
+        plan = self.plan(modified_issue, *compare_issues(original_issue, modified_issue))
+        if not plan:
+            return
+        failed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(plan), MUTATION_WORKERS)) as executor:
+                results = list(executor.map(send_mutation, plan))
+            for mutation, (response, error) in zip(plan, results):
+                if error is not None:
+                    failed += 1
+                    warn("cannot send the {} change {}: {}", mutation.kind, mutation.target, error)
+                    continue
+                getattr(self, "apply_" + mutation.kind)(mutation.target, response)
+        finally:
+            self.issue_storage.set(view_id, IssueEntry(self.issue, self.label_set, self.comments))
+        if failed:
+            sublime.status_message("{} of {} changes were not sent, save again to retry".format(failed, len(plan)))
+
+    def plan(self, modified_issue, issue_change, label_change, comment_change, deleted_comments):
+        number = self.issue['number']
+        plan = []
         if label_change != -1:
-            log("new labels are {}".format(repr(label_change)))
-            self.issue_list.attach_labels(original_issue['issue']['number'],
-                                          list(label_change))
-            self.view.run_command(
-                "insert_issue_snippet",
-                {"start_point": self.view.size(),
-                 "snippet": "\n*<The issue has new labels {}>*".format(repr(label_change))})
-        if comment_change:
-            for comment_id, content in comment_change.items():
-                updating_comment = self.issue_list.update_comment(
-                    comment_id=comment_id, data=json.dumps({'body': content}))
-                if updating_comment.status_code in (200, 201):
-                    sublime.status_message("Comment updated")
-                    original_issue["comments"][
-                        comment_id] = updating_comment.json()
-                    self.view.run_command(
-                        "insert_issue_snippet",
-                        {"start_point": self.view.size(),
-                         "snippet": "\n*<Comment ID {} updated at {}>*".format(
-                             str(comment_id),
-                             updating_comment.json()['updated_at'])})
-                else:
-                    sublime.status_message("Comment update fails")
-                    log("issue update fails, error code " + str(
-                        updating_comment.status_code))
-        if deleted_comments:
-            for comment_id in deleted_comments:
-                deleted_comment = self.issue_list.delete_comment(
-                    comment_id=comment_id)
-                if deleted_comment.status_code == 204:
-                    del original_issue["comments"][comment_id]
-                    sublime.status_message("Comment deleted.")
-                    self.view.run_command("insert_issue_snippet", {
-                        "start_point": self.view.size(),
-                        "snippet":
-                        "\n*<Comment ID {} deleted.>*".format(str(comment_id))
-                    })
-                else:
-                    sublime.status_message("Fail to delete comment!")
+            log("new labels are {!r}", label_change)
+            self.issue_list.create_missing_labels(label_change)
+            issue_change = dict(issue_change, labels=sorted(label_change))
+        if issue_change:
+            plan.append(Mutation("issue", label_change, partial(
+                self.issue_list.update_issue, number, data=json.dumps(issue_change))))
+        for comment_id in sorted(comment_change):
+            data = json.dumps({'body': comment_change[comment_id]})
+            plan.append(Mutation("comment", comment_id, partial(
+                self.issue_list.update_comment, comment_id=comment_id, data=data)))
+        for comment_id in sorted(deleted_comments):
+            plan.append(Mutation("deletion", comment_id, partial(
+                self.issue_list.delete_comment, comment_id=comment_id)))
         if modified_issue['new_comment']:
-            new_comment = self.issue_list.post_comment(
-                modified_issue['issue']['number'],
-                data=json.dumps({'body': modified_issue['new_comment']}))
-            if new_comment.status_code in (200, 201):
-                sublime.status_message("Comment Posted")
-                original_issue["comments"][new_comment.json()[
-                    'id']] = new_comment.json()
-                snippet = format_comment(new_comment.json())
-                snippet += ADD_COMMENT() + LINE_END
-                snippet += LINE_END
-                snippet += CONTENT_END()
-                a, b = find_comment_region(self.view)
-                log("insert the snippet")
-                self.view.run_command("replace_snippet", {"start_point": a,
-                                                          "end_point": b,
-                                                          "snippet": snippet})
-                self.view.run_command(
-                    "insert_issue_snippet",
-                    {"start_point": self.view.size(),
-                     "snippet": "\n*<Comment ID {} created at {}>*".format(
-                         str(new_comment.json()['id']),
-                         new_comment.json()['created_at'])})
-                comment_id = new_comment.json()['id']
-                log("new comment id is " + str(comment_id))
-
-            else:
-                sublime.status_message("Comment post fails")
-                log("comment post fails, error code " + str(
-                    new_comment.status_code))
-        restock(self.issue_storage, view_id, original_issue)
+            data = json.dumps({'body': modified_issue['new_comment']})
+            plan.append(Mutation("new_comment", None, partial(
+                self.issue_list.post_comment, number, data=data)))
+        log("planned {} requests", len(plan))
+        return plan
+
+    def annotate(self, snippet):
+        self.view.run_command("insert_issue_snippet", {"start_point": self.view.size(),
+                                                       "snippet": snippet})
+
+    def apply_issue(self, label_change, response):
+        if response.status_code not in (200, 201):
+            sublime.status_message("Issue update fails")
+            log("issue update fails, error code {}", response.status_code)
+            return
+        sublime.status_message("Issue updated")
+        updated = response.json()
+        last_updated_time = self.issue['updated_at']
+        self.issue = snapshot_issue(updated)
+        self.label_set = frozenset(label['name'] for label in updated['labels'])
+        issue_store.save_issues(self.repo, [updated])
+        if updated['updated_at'] != last_updated_time:
+            self.annotate("\n*<Issue number {} updated at {}>*".format(str(updated['id']), updated['updated_at']))
+        if label_change != -1:
+            self.annotate("\n*<The issue has new labels {}>*".format(repr(sorted(label_change))))
+
+    def apply_comment(self, comment_id, response):
+        if response.status_code not in (200, 201):
+            sublime.status_message("Comment update fails")
+            log("comment update fails, error code {}", response.status_code)
+            return
+        sublime.status_message("Comment updated")
+        self.comments[comment_id] = snapshot_comment(response.json())
+        issue_store.save_comments(self.repo, self.issue['number'], [response.json()], complete=False)
+        self.annotate("\n*<Comment ID {} updated at {}>*".format(str(comment_id), response.json()['updated_at']))
+
+    def apply_deletion(self, comment_id, response):
+        if response.status_code != 204:
+            sublime.status_message("Fail to delete comment!")
+            return
+        del self.comments[comment_id]
+        issue_store.delete_comment(self.repo, comment_id)
+        sublime.status_message("Comment deleted.")
+        self.annotate("\n*<Comment ID {} deleted.>*".format(str(comment_id)))
+
+    def apply_new_comment(self, _, response):
+        if response.status_code not in (200, 201):
+            sublime.status_message("Comment post fails")
+            log("comment post fails, error code {}", response.status_code)
+            return
+        sublime.status_message("Comment Posted")
+        new_comment = response.json()
+        self.comments[new_comment['id']] = snapshot_comment(new_comment)
+        issue_store.save_comments(self.repo, self.issue['number'], [new_comment], complete=False)
+        clear_new_comment(self.view)
+        insert_comments(self.view, [new_comment])
+        global_person_list.setdefault(self.view.id(), set()).add(new_comment['user']['login'])
+        self.annotate("\n*<Comment ID {} created at {}>*".format(str(new_comment['id']), new_comment['created_at']))
+        log("new comment id is {}", new_comment['id'])
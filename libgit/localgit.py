@@ -0,0 +1,242 @@
+import os
+import zlib
+import struct
+import shutil
+import bisect
+import subprocess
+from .. import log
+
+OBJ_COMMIT = 1
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+TYPE_NAMES = {1: b"commit", 2: b"tree", 3: b"blob", 4: b"tag"}
+
+
+def find_git(git_path=None):
+    if git_path and os.path.exists(git_path):
+        return git_path
+    return shutil.which("git")
+
+
+def read_local_commits(git_dir, git_path=None):
+    '''
+    Collect (sha, message) pairs reachable from HEAD of a local checkout.
+    It asks "git log" first and reads the object store directly when git
+    is not installed or fails.
+    '''
+    git = find_git(git_path)
+    if git:
+        try:
+            return git_log_commits(git, git_dir)
+        except (OSError, subprocess.CalledProcessError) as error:
+            log("git log failed ({}), reading the object store", error)
+    return ObjectStore(git_dir).commits()
+
+
+def git_log_commits(git, git_dir):
+    startupinfo = None
+    if os.name == "nt":
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    output = subprocess.check_output(
+        [git, "--git-dir", git_dir, "log", "--format=%H%x00%B%x1e"],
+        stderr=subprocess.STDOUT, startupinfo=startupinfo)
+    commit_set = set([])
+    for record in output.decode("utf-8", "replace").split("\x1e"):
+        record = record.strip()
+        if "\x00" in record:
+            sha, message = record.split("\x00", 1)
+            commit_set.add((sha, message.strip()))
+    return commit_set
+
+
+class PackIndex:
+    '''
+    Version 2 pack index: sorted object names with their pack offsets.
+    '''
+
+    def __init__(self, idx_path):
+        with open(idx_path, "rb") as idx_file:
+            data = idx_file.read()
+        if data[:4] != b"\xfftOc" or struct.unpack(">I", data[4:8])[0] != 2:
+            raise Exception("unsupported pack index {}".format(idx_path))
+        count = struct.unpack(">I", data[8 + 255 * 4:8 + 256 * 4])[0]
+        sha_start = 8 + 256 * 4
+        offset_start = sha_start + count * 20 + count * 4
+        large_start = offset_start + count * 4
+        self.names = [data[sha_start + i * 20:sha_start + (i + 1) * 20] for i in range(count)]
+        self.offsets = []
+        for i in range(count):
+            offset = struct.unpack(">I", data[offset_start + i * 4:offset_start + (i + 1) * 4])[0]
+            if offset & 0x80000000:
+                position = large_start + (offset & 0x7fffffff) * 8
+                offset = struct.unpack(">Q", data[position:position + 8])[0]
+            self.offsets.append(offset)
+        self.pack_path = idx_path[:-4] + ".pack"
+
+    def find(self, binary_sha):
+        position = bisect.bisect_left(self.names, binary_sha)
+        if position < len(self.names) and self.names[position] == binary_sha:
+            return self.offsets[position]
+        return None
+
+
+class ObjectStore:
+    '''
+    Minimal reader for loose objects and packfiles, enough to walk commits.
+    '''
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.objects_dir = os.path.join(git_dir, "objects")
+        self.packs = []
+        pack_dir = os.path.join(self.objects_dir, "pack")
+        if os.path.isdir(pack_dir):
+            for name in os.listdir(pack_dir):
+                if name.endswith(".idx"):
+                    try:
+                        self.packs.append(PackIndex(os.path.join(pack_dir, name)))
+                    except Exception as error:
+                        log("skip pack index {}: {}", name, error)
+        self.pack_files = {}
+
+    def resolve_ref(self, ref="HEAD"):
+        for _ in range(10):
+            ref_path = os.path.join(self.git_dir, ref)
+            if os.path.isfile(ref_path):
+                with open(ref_path) as ref_file:
+                    content = ref_file.read().strip()
+            else:
+                content = self.packed_ref(ref)
+            if not content:
+                return None
+            if content.startswith("ref:"):
+                ref = content[4:].strip()
+            else:
+                return content
+        return None
+
+    def packed_ref(self, ref):
+        packed_path = os.path.join(self.git_dir, "packed-refs")
+        if not os.path.isfile(packed_path):
+            return None
+        with open(packed_path) as packed_file:
+            for line in packed_file:
+                parts = line.strip().split(" ")
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+        return None
+
+    def read_object(self, sha):
+        loose_path = os.path.join(self.objects_dir, sha[:2], sha[2:])
+        if os.path.isfile(loose_path):
+            with open(loose_path, "rb") as loose_file:
+                raw = zlib.decompress(loose_file.read())
+            header, _, body = raw.partition(b"\x00")
+            return header.split(b" ")[0], body
+        binary_sha = bytes(bytearray.fromhex(sha))
+        for pack in self.packs:
+            offset = pack.find(binary_sha)
+            if offset is not None:
+                return self.read_packed(pack, offset)
+        raise KeyError(sha)
+
+    def read_packed(self, pack, offset):
+        pack_file = self.pack_files.get(pack.pack_path)
+        if not pack_file:
+            pack_file = open(pack.pack_path, "rb")
+            self.pack_files[pack.pack_path] = pack_file
+        pack_file.seek(offset)
+        byte = pack_file.read(1)[0]
+        object_type = (byte >> 4) & 7
+        while byte & 0x80:
+            byte = pack_file.read(1)[0]
+        if object_type == OBJ_OFS_DELTA:
+            byte = pack_file.read(1)[0]
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = pack_file.read(1)[0]
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            delta = self.inflate(pack_file)
+            base_type, base = self.read_packed(pack, offset - distance)
+            return base_type, apply_delta(base, delta)
+        if object_type == OBJ_REF_DELTA:
+            base_sha = pack_file.read(20)
+            delta = self.inflate(pack_file)
+            base_type, base = self.read_object("".join("{:02x}".format(b) for b in bytearray(base_sha)))
+            return base_type, apply_delta(base, delta)
+        return TYPE_NAMES[object_type], self.inflate(pack_file)
+
+    @staticmethod
+    def inflate(pack_file):
+        decompressor = zlib.decompressobj()
+        chunks = []
+        while not decompressor.eof:
+            chunk = pack_file.read(4096)
+            if not chunk:
+                break
+            chunks.append(decompressor.decompress(chunk))
+        return b"".join(chunks)
+
+    def commits(self):
+        commit_set = set([])
+        head = self.resolve_ref()
+        pending = [head] if head else []
+        seen = set(pending)
+        try:
+            while pending:
+                sha = pending.pop()
+                object_type, body = self.read_object(sha)
+                if object_type != b"commit":
+                    continue
+                header, _, message = body.partition(b"\n\n")
+                for line in header.split(b"\n"):
+                    if line.startswith(b"parent "):
+                        parent = line[7:].decode("ascii")
+                        if parent not in seen:
+                            seen.add(parent)
+                            pending.append(parent)
+                commit_set.add((sha, message.decode("utf-8", "replace").strip()))
+        finally:
+            for pack_file in self.pack_files.values():
+                pack_file.close()
+            self.pack_files = {}
+        return commit_set
+
+
+def read_varint(delta, position):
+    value = shift = 0
+    while True:
+        byte = delta[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def apply_delta(base, delta):
+    delta = bytearray(delta)
+    _, position = read_varint(delta, 0)
+    _, position = read_varint(delta, position)
+    result = []
+    while position < len(delta):
+        opcode = delta[position]
+        position += 1
+        if opcode & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= delta[position] << (8 * i)
+                    position += 1
+            for i in range(3):
+                if opcode & (0x10 << i):
+                    size |= delta[position] << (8 * i)
+                    position += 1
+            result.append(base[offset:offset + (size or 0x10000)])
+        elif opcode:
+            result.append(bytes(delta[position:position + opcode]))
+            position += opcode
+        else:
+            raise Exception("invalid delta opcode")
+    return b"".join(result)
@@ -0,0 +1,157 @@
+import time
+import heapq
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+from .. import warn
+
+INTERACTIVE = 0
+MUTATION = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", MUTATION: "mutation", BACKGROUND: "background"}
+
+# share of the hourly budget that lower priorities must leave untouched
+RESERVES = {INTERACTIVE: 0.0, MUTATION: 0.05, BACKGROUND: 0.2}
+
+
+class RequestScheduler:
+    '''
+    Every GitHub request waits here for its turn. The remaining rate limit
+    reported by GitHub is used as a token bucket that refills at the reset
+    time, minus the requests still in flight; lower priorities stop before
+    eating the share reserved for higher ones, and secondary rate limits
+    block everybody until Retry-After. Only the headers of the responses
+    lower the bucket, so conditional requests answered 304 cost nothing.
+    '''
+
+    def __init__(self, max_in_flight=6, max_retries=2):
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.counter = itertools.count()
+        self.in_flight = 0
+        self.limit = None
+        self.remaining = None
+        self.reset_at = 0
+        self.blocked_until = 0
+        self.counts = dict((priority, 0) for priority in PRIORITY_NAMES)
+        self.total_wait = dict((priority, 0.0) for priority in PRIORITY_NAMES)
+        self.max_wait = dict((priority, 0.0) for priority in PRIORITY_NAMES)
+
+    def delay(self, priority):
+        now = time.time()
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.remaining is None:
+            return 0
+        if self.reset_at <= now:
+            self.remaining = self.limit
+            return 0
+        if self.remaining - self.in_flight <= (self.limit or 0) * RESERVES[priority]:
+            return self.reset_at - now
+        return 0
+
+    def can_spend(self, priority):
+        with self.condition:
+            return self.delay(priority) <= 0
+
+    def acquire(self, priority):
+        ticket = (priority, next(self.counter))
+        start = time.time()
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                delay = self.delay(priority)
+                if self.waiting[0] == ticket and self.in_flight < self.max_in_flight and delay <= 0:
+                    break
+                self.condition.wait(delay if delay > 0 else None)
+            heapq.heappop(self.waiting)
+            self.in_flight += 1
+            waited = time.time() - start
+            self.counts[priority] += 1
+            self.total_wait[priority] += waited
+            self.max_wait[priority] = max(self.max_wait[priority], waited)
+            self.condition.notify_all()
+
+    def release(self, response):
+        with self.condition:
+            self.in_flight -= 1
+            try:
+                if response is not None:
+                    self.update(response)
+            finally:
+                self.condition.notify_all()
+
+    def update(self, response):
+        headers = response.headers
+        try:
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+                self.limit = int(headers.get("X-RateLimit-Limit", self.limit or 0))
+                self.reset_at = int(headers.get("X-RateLimit-Reset", 0))
+        except ValueError:
+            pass
+        if self.is_rate_limited(response):
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            if retry_after is not None:
+                self.blocked_until = time.time() + retry_after
+            elif self.remaining == 0:
+                self.blocked_until = self.reset_at
+            else:
+                self.blocked_until = time.time() + 60
+            warn("rate limited, requests blocked for {:.0f} seconds", self.blocked_until - time.time())
+
+    @staticmethod
+    def is_rate_limited(response):
+        if response.status_code == 429:
+            return True
+        return response.status_code == 403 and (
+            "Retry-After" in response.headers or
+            response.headers.get("X-RateLimit-Remaining") == "0" or
+            "rate limit" in response.text.lower())
+
+    def request(self, send, priority=INTERACTIVE):
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority)
+            response = None
+            try:
+                response = send()
+            finally:
+                self.release(response)
+            if not self.is_rate_limited(response) or response.headers.get("X-RateLimit-Remaining") == "0":
+                break
+        return response
+
+    def stats(self):
+        with self.condition:
+            result = {"queue_depth": len(self.waiting),
+                      "in_flight": self.in_flight,
+                      "remaining": self.remaining,
+                      "limit": self.limit}
+            for priority, name in PRIORITY_NAMES.items():
+                count = self.counts[priority]
+                result[name] = {"requests": count,
+                                "average_wait": self.total_wait[priority] / count if count else 0.0,
+                                "max_wait": self.max_wait[priority]}
+            return result
+
+
+def parse_retry_after(value):
+    '''
+    Seconds to wait from a Retry-After header, given in seconds or as an
+    HTTP date; None if it is missing or cannot be read.
+    '''
+    if not value:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+scheduler = RequestScheduler()
@@ -0,0 +1,78 @@
+import json
+import threading
+from .. import span
+
+
+class Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''
+    Collapse concurrent calls with the same key into one: the first caller
+    runs the function, the others wait for its result.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, function):
+        with self.lock:
+            self.calls += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+            else:
+                self.shared += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function()
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+
+    def running(self, key):
+        with self.lock:
+            return key in self.flights
+
+    def stats(self):
+        with self.lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self.flights)}
+
+
+def flight_key(*parts):
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+def decode_once(response):
+    '''
+    Decode the JSON body once and let every holder of the response reuse it.
+    '''
+    try:
+        with span("parse"):
+            data = response.json()
+    except ValueError:
+        return response
+    response.json = lambda **kwargs: data
+    return response
+
+
+get_flights = SingleFlight()
@@ -0,0 +1,152 @@
+import os
+import json
+import threading
+import sublime
+from collections import namedtuple
+from .. import log
+
+RepoEntry = namedtuple("RepoEntry", ["username", "repo_name", "links"])
+IssueEntry = namedtuple("IssueEntry", ["issue", "label", "comments"])
+CommentSnapshot = namedtuple("CommentSnapshot", ["body", "updated_at"])
+# a cached issue list page: the decoded issues and the compact pagination links
+ListPage = namedtuple("ListPage", ["issues", "links"])
+
+# the issue fields that can be edited in an issue view, plus what identifies it
+ISSUE_FIELDS = ("number", "title", "state", "locked", "body", "updated_at")
+
+
+def compact_links(response):
+    '''
+    Keep only the pagination urls of a response.
+    '''
+    if response is None:
+        return None
+    return dict((relation, link["url"]) for relation, link in response.links.items())
+
+
+def list_page(response):
+    return ListPage(response.json(), compact_links(response))
+
+
+def snapshot_issue(issue):
+    fields = dict((key, issue.get(key)) for key in ISSUE_FIELDS)
+    fields["assignee"] = issue["assignee"]["login"] if issue.get("assignee") else None
+    return fields
+
+
+def snapshot_comment(comment):
+    return CommentSnapshot(comment["body"], comment["updated_at"])
+
+
+def snapshot_issue_entry(issue, comments):
+    return IssueEntry(snapshot_issue(issue),
+                      frozenset(label["name"] for label in issue["labels"]),
+                      dict((comment["id"], snapshot_comment(comment)) for comment in comments))
+
+
+def encode_issue_entry(entry):
+    return {"issue": entry.issue, "label": sorted(entry.label),
+            "comments": [[comment_id, comment.body, comment.updated_at]
+                         for comment_id, comment in entry.comments.items()]}
+
+
+def decode_issue_entry(data):
+    return IssueEntry(data["issue"], frozenset(data["label"]),
+                      dict((comment_id, CommentSnapshot(body, updated_at))
+                           for comment_id, body, updated_at in data["comments"]))
+
+
+class Spilled:
+    __slots__ = ("path",)
+
+    def __init__(self, path):
+        self.path = path
+
+
+class ViewStateRegistry:
+    '''
+    State of the open views keyed by view id. Entries are immutable tuples
+    replaced as a whole, so readers (completion and selection handlers) never
+    take the lock; writers only hold it for a single dict operation. Entries
+    of hidden views can be spilled to disk and are loaded back on access.
+    '''
+
+    def __init__(self, name, encode=None, decode=None):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def __getitem__(self, view_id):
+        entry = self.entries[view_id]
+        if isinstance(entry, Spilled):
+            entry = self.restore(view_id)
+        return entry
+
+    def __contains__(self, view_id):
+        return view_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, view_id, default=None):
+        try:
+            return self[view_id]
+        except KeyError:
+            return default
+
+    def set(self, view_id, entry):
+        with self.lock:
+            self.entries[view_id] = entry
+
+    def pop(self, view_id):
+        with self.lock:
+            entry = self.entries.pop(view_id, None)
+        if isinstance(entry, Spilled):
+            self.remove(entry)
+            return None
+        return entry
+
+    def spill(self, view_id):
+        '''
+        Move the entry of a hidden view to disk; it is read back on next use.
+        '''
+        if not self.encode:
+            return
+        with self.lock:
+            entry = self.entries.get(view_id)
+            if entry is None or isinstance(entry, Spilled):
+                return
+            directory = os.path.join(sublime.cache_path(), "GitHubIssue", "views")
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            path = os.path.join(directory, "{}-{}.json".format(self.name, view_id))
+            with open(path, "w", encoding="utf-8") as spill_file:
+                json.dump(self.encode(entry), spill_file)
+            self.entries[view_id] = Spilled(path)
+        log("spill the {} state of view {}", self.name, view_id)
+
+    def restore(self, view_id):
+        with self.lock:
+            entry = self.entries[view_id]
+            if isinstance(entry, Spilled):
+                spilled, entry = entry, self.load(entry)
+                self.entries[view_id] = entry
+                self.remove(spilled)
+            return entry
+
+    def load(self, spilled):
+        with open(spilled.path, encoding="utf-8") as spill_file:
+            return self.decode(json.load(spill_file))
+
+    @staticmethod
+    def remove(spilled):
+        try:
+            os.remove(spilled.path)
+        except OSError:
+            pass
+
+
+repo_info_storage = ViewStateRegistry("repo")
+issue_obj_storage = ViewStateRegistry("issue", encode_issue_entry, decode_issue_entry)
@@ -0,0 +1,255 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import sublime
+from .. import log
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS issues (repo TEXT, number INTEGER, state TEXT, title TEXT, "
+    "updated_at TEXT, data TEXT, PRIMARY KEY (repo, number))",
+    "CREATE TABLE IF NOT EXISTS comments (repo TEXT, issue_number INTEGER, id INTEGER, "
+    "updated_at TEXT, data TEXT, PRIMARY KEY (repo, id))",
+    "CREATE INDEX IF NOT EXISTS comments_by_issue ON comments (repo, issue_number)",
+    "CREATE TABLE IF NOT EXISTS labels (repo TEXT, name TEXT, PRIMARY KEY (repo, name))",
+    "CREATE TABLE IF NOT EXISTS sync_state (repo TEXT PRIMARY KEY, since TEXT)",
+    "CREATE TABLE IF NOT EXISTS search_docs (docid INTEGER PRIMARY KEY AUTOINCREMENT, repo TEXT, "
+    "number INTEGER, comment_id INTEGER, UNIQUE (repo, number, comment_id))",
+)
+SEARCH_ENGINES = (
+    ("fts5", ("CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(title, body)",
+              "INSERT INTO search(search, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")),
+    ("fts4", ("CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts4(title, body)",)),
+)
+
+
+class IssueStore:
+    '''
+    Local SQLite copy of issues, comments and labels, one row per object
+    keyed by "owner/repo". It survives restarts and serves views offline.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+        self.search_engine = None
+
+    def connect(self):
+        if self.connection is None:
+            if not self.path:
+                directory = os.path.join(sublime.cache_path(), "GitHubIssue")
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                self.path = os.path.join(directory, "issues.sqlite")
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            for engine, statements in SEARCH_ENGINES:
+                try:
+                    for statement in statements:
+                        self.connection.execute(statement)
+                except sqlite3.OperationalError as error:
+                    log("{} is not available: {}", engine, error)
+                    continue
+                self.search_engine = engine
+                break
+            if self.search_engine and not self.connection.execute(
+                    "SELECT COUNT(*) FROM search_docs").fetchone()[0]:
+                for repo, data in self.connection.execute("SELECT repo, data FROM issues").fetchall():
+                    issue = json.loads(data)
+                    self.index_document(self.connection, repo, issue["number"], 0,
+                                        issue["title"], issue["body"])
+            self.connection.commit()
+        return self.connection
+
+    def execute(self, statement, parameters=()):
+        with self.lock:
+            return self.connect().execute(statement, parameters).fetchall()
+
+    def executemany(self, statement, rows):
+        with self.lock:
+            connection = self.connect()
+            connection.executemany(statement, rows)
+            connection.commit()
+
+    def save_issues(self, repo, issues):
+        with self.lock:
+            connection = self.connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?)",
+                [(repo, issue["number"], issue["state"], issue["title"], issue["updated_at"], json.dumps(issue))
+                 for issue in issues])
+            for issue in issues:
+                self.index_document(connection, repo, issue["number"], 0, issue["title"], issue["body"])
+            connection.commit()
+
+    def index_document(self, connection, repo, number, comment_id, title, body):
+        if not self.search_engine:
+            return
+        connection.execute("INSERT OR IGNORE INTO search_docs (repo, number, comment_id) VALUES (?, ?, ?)",
+                           (repo, number, comment_id))
+        docid = connection.execute(
+            "SELECT docid FROM search_docs WHERE repo = ? AND number = ? AND comment_id = ?",
+            (repo, number, comment_id)).fetchone()[0]
+        connection.execute("DELETE FROM search WHERE rowid = ?", (docid,))
+        connection.execute("INSERT INTO search (rowid, title, body) VALUES (?, ?, ?)",
+                           (docid, title or "", body or ""))
+
+    def unindex_document(self, connection, repo, comment_id):
+        if not self.search_engine:
+            return
+        row = connection.execute("SELECT docid FROM search_docs WHERE repo = ? AND comment_id = ?",
+                                 (repo, comment_id)).fetchone()
+        if row:
+            connection.execute("DELETE FROM search WHERE rowid = ?", (row[0],))
+            connection.execute("DELETE FROM search_docs WHERE docid = ?", (row[0],))
+
+    def unindex_comments(self, connection, repo, issue_number):
+        if not self.search_engine:
+            return
+        docids = [row[0] for row in connection.execute(
+            "SELECT docid FROM search_docs WHERE repo = ? AND number = ? AND comment_id != 0",
+            (repo, issue_number)).fetchall()]
+        connection.executemany("DELETE FROM search WHERE rowid = ?", [(docid,) for docid in docids])
+        connection.executemany("DELETE FROM search_docs WHERE docid = ?", [(docid,) for docid in docids])
+
+    def search(self, repo, query, limit=100):
+        '''
+        Rank the stored issues of a repo by how well their title, body and
+        comments match every word of the query (as a prefix).
+        '''
+        terms = re.findall(r"\w+", query, re.UNICODE)
+        with self.lock:
+            connection = self.connect()
+            if not terms:
+                return []
+            if self.search_engine:
+                # quoted so that words like NOT or OR are not read as operators
+                if self.search_engine == "fts5":
+                    match = " ".join('"{}"*'.format(term) for term in terms)
+                    order = "MIN(search.rank)"
+                else:
+                    match = " ".join('"{}*"'.format(term) for term in terms)
+                    order = "-COUNT(*)"
+                rows = connection.execute(
+                    "SELECT issues.data FROM search JOIN search_docs ON search_docs.docid = search.rowid "
+                    "JOIN issues ON issues.repo = search_docs.repo AND issues.number = search_docs.number "
+                    "WHERE search MATCH ? AND search_docs.repo = ? "
+                    "GROUP BY search_docs.number ORDER BY {}, search_docs.number DESC LIMIT ?".format(order),
+                    (match, repo, limit)).fetchall()
+            else:
+                condition = " AND ".join(["(title LIKE ? OR data LIKE ?)"] * len(terms))
+                parameters = [repo]
+                for term in terms:
+                    parameters.extend(["%" + term + "%"] * 2)
+                rows = connection.execute(
+                    "SELECT data FROM issues WHERE repo = ? AND {} ORDER BY number DESC LIMIT ?".format(condition),
+                    parameters + [limit]).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def save_comments(self, repo, issue_number, comments, complete=True):
+        rows = [(repo, issue_number, comment["id"], comment["updated_at"], json.dumps(comment))
+                for comment in comments]
+        with self.lock:
+            connection = self.connect()
+            if complete:
+                connection.execute("DELETE FROM comments WHERE repo = ? AND issue_number = ?",
+                                   (repo, issue_number))
+                self.unindex_comments(connection, repo, issue_number)
+            connection.executemany("INSERT OR REPLACE INTO comments VALUES (?, ?, ?, ?, ?)", rows)
+            for comment in comments:
+                self.index_document(connection, repo, issue_number, comment["id"], "", comment["body"])
+            connection.commit()
+
+    def delete_comment(self, repo, comment_id):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("DELETE FROM comments WHERE repo = ? AND id = ?", (repo, comment_id))
+            self.unindex_document(connection, repo, comment_id)
+            connection.commit()
+
+    def save_labels(self, repo, labels):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("DELETE FROM labels WHERE repo = ?", (repo,))
+            connection.executemany("INSERT INTO labels VALUES (?, ?)",
+                                   [(repo, name) for name in labels])
+            connection.commit()
+
+    def labels(self, repo):
+        return set(row[0] for row in self.execute(
+            "SELECT name FROM labels WHERE repo = ?", (repo,)))
+
+    def list_issues(self, repo, state="open", page=1, per_page=30):
+        if state == "all":
+            rows = self.execute(
+                "SELECT data FROM issues WHERE repo = ? ORDER BY number DESC LIMIT ? OFFSET ?",
+                (repo, per_page, (page - 1) * per_page))
+        else:
+            rows = self.execute(
+                "SELECT data FROM issues WHERE repo = ? AND state = ? ORDER BY number DESC LIMIT ? OFFSET ?",
+                (repo, state, per_page, (page - 1) * per_page))
+        return [json.loads(row[0]) for row in rows]
+
+    def titles(self, repo):
+        return [(title, number, 0 if state == "open" else 1) for title, number, state in self.execute(
+            "SELECT title, number, state FROM issues WHERE repo = ?", (repo,))]
+
+    def get_issue(self, repo, number):
+        rows = self.execute("SELECT data FROM issues WHERE repo = ? AND number = ?", (repo, number))
+        if not rows:
+            return None
+        comments = self.execute(
+            "SELECT data FROM comments WHERE repo = ? AND issue_number = ? ORDER BY id", (repo, number))
+        return json.loads(rows[0][0]), [json.loads(row[0]) for row in comments]
+
+    def get_comment(self, repo, comment_id):
+        rows = self.execute("SELECT data FROM comments WHERE repo = ? AND id = ?", (repo, comment_id))
+        return json.loads(rows[0][0]) if rows else None
+
+    def since(self, repo):
+        rows = self.execute("SELECT since FROM sync_state WHERE repo = ?", (repo,))
+        return rows[0][0] if rows else None
+
+    def set_since(self, repo, since):
+        self.executemany("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", [(repo, since)])
+
+    def sync(self, issue_obj, on_page=None, cancelled=None):
+        '''
+        Pull the issues updated since the last sync and return how many changed.
+        The first sync downloads every page concurrently. Once cancelled()
+        is true the sync stops between pages and keeps what it saved.
+        '''
+        repo = "{}/{}".format(issue_obj.username, issue_obj.repo_name)
+        since = self.since(repo)
+        params = {"state": "all", "sort": "updated", "direction": "asc"}
+        if since:
+            params["since"] = since
+            pages = issue_obj.iter_pages(issue_obj.github_account.join_url(
+                username=issue_obj.username, repo_name=issue_obj.repo_name, sequence=['issues']),
+                params, per_page=100, read_ahead=True)
+        else:
+            pages = issue_obj.get_pages(params=params)
+            if pages is None:
+                raise Exception(
+                    "Cannnot find relevant repo info, please check the input!")
+        changed = 0
+        for page in pages:
+            if cancelled and cancelled():
+                log("stop syncing {}", repo)
+                break
+            self.save_issues(repo, page)
+            if on_page:
+                on_page(page)
+            changed += len(page)
+            if page:
+                since = max(since or "", max(issue["updated_at"] for issue in page))
+        if since:
+            self.set_since(repo, since)
+        log("synced {} issues of {} up to {}", changed, repo, since)
+        return changed
+
+
+issue_store = IssueStore()
@@ -1,9 +1,14 @@
 import sublime
 import re
 from .. import LINE_END
-from .. import log, settings
-from .. import COMMENT_START, COMMENT_END, ISSUE_START, ISSUE_END, HEADER_END, CONTENT_END, ADD_COMMENT, COMMENT_INFO
+from .. import log, span, settings
+from .. import COMMENT_START, COMMENT_END, ISSUE_START, ISSUE_END, HEADER_END, COMMENT_INFO
+from .. import COMMENT_COLLAPSED
+from .. import marker_table
+from .state import repo_info_storage
+from .store import issue_store
 import os
+from urllib.parse import urlparse, parse_qs
 
 
 def configure_issue_view(view):
@@ -33,8 +38,8 @@ def print_list_framework(view=None):
     snippet = ''
     snippet += "=" * 50 + LINE_END
     snippet += 'Issue No.' + '   ' + 'Locked    ' + 'Issue Title' + LINE_END
-    snippet += "=" * 24 + '**' + "=" * 24 + LINE_END
-    snippet += "=" * 23 + "*" * 4 + "=" * 23 + LINE_END * 3
+    snippet += LIST_START + LINE_END
+    snippet += LIST_END + LINE_END * 3
     snippet += "Page:  |_First_|     ...     |_Prev_|     ...     |_Next_|     ...     |_Last_|" + LINE_END
     if not view:
         view = sublime.active_window().new_file()
@@ -54,34 +59,21 @@ def print_list_framework(view=None):
 
 def find_list_region(view=None):
     view_converter = ViewConverter(view)
-    _, start_point, end_point, _ = view_converter.find_region_line(
-        "=" * 24 + '**' + "=" * 24, "=" * 23 + "*" * 4 + "=" * 23)
+    _, start_point, end_point, _ = view_converter.find_region_line(LIST_START, LIST_END)
     return (start_point, end_point)
 
 
-def restock(storage, key, item):
-    if not storage.empty():
-        dictionary = storage.get()
-        dictionary[key] = item
-        storage.put(dictionary)
+LIST_START = "=" * 24 + '**' + "=" * 24
+LIST_END = "=" * 23 + "*" * 4 + "=" * 23
 
 
-def show_stock(storage, key):
-    if not storage.empty():
-        dictionary = storage.get()
-        content = dictionary[key]
-        storage.put(dictionary)
-        return content
-
-
-def destock(storage, key):
-    if not storage.empty():
-        dictionary = storage.get()
-        try:
-            del dictionary[key]
-        except:
-            pass
-        storage.put(dictionary)
+def page_number(url, default=1):
+    if not url:
+        return default
+    try:
+        return int(parse_qs(urlparse(url).query)["page"][0])
+    except (KeyError, IndexError, ValueError):
+        return default
 
 
 def format_issue(issue):
@@ -102,26 +94,69 @@ def format_issue(issue):
     snippet += ISSUE_START() + LINE_END
     snippet += filter_fake_crucial_lines(filter_line_ends(issue['body'])) + LINE_END
     snippet += ISSUE_END() + LINE_END
-    log("Issue title " + issue["title"] + " formated")
+    log("Issue title {} formated", issue["title"])
     return snippet
 
 
 def filter_fake_crucial_lines(content):
-    robust_content = []
-    for line in content.split(LINE_END):
-        temp_line = line
-        if line.startswith("*") or line.startswith("#"):
-            for candidate in (COMMENT_START('')[:25],
-                              COMMENT_END('')[:25],
-                              ISSUE_START(),
-                              ISSUE_END(),
-                              HEADER_END(),
-                              CONTENT_END(),
-                              ADD_COMMENT()):
-                if line.startswith(candidate):
-                    temp_line = " " + line
-        robust_content.append(temp_line)
-    return LINE_END.join(robust_content)
+    return marker_table.get("fake").sub(" ", content)
+
+
+def format_comments(comments, collapsed=()):
+    '''
+    One snippet for several comments, with the (start, end) offsets of their
+    marker lines inside it by marker type. Comments in collapsed are written
+    as placeholders.
+    '''
+    parts = []
+    lines = {'comment_start': [], 'comment_end': [], 'comment_collapsed': []}
+    offset = 0
+    for comment in comments:
+        if comment['id'] in collapsed:
+            snippet = format_collapsed(comment)
+            lines['comment_collapsed'].append((offset, offset + len(snippet) - len(LINE_END)))
+        else:
+            snippet = format_comment(comment)
+            start_line = len(COMMENT_START(comment['id']))
+            end_line = len(COMMENT_END(comment['id']))
+            lines['comment_start'].append((offset, offset + start_line))
+            end_at = offset + len(snippet) - end_line - len(LINE_END)
+            lines['comment_end'].append((end_at, end_at + end_line))
+        parts.append(snippet)
+        offset += len(snippet)
+    return "".join(parts), lines
+
+
+def insert_comments(view, comments, collapsed=()):
+    '''
+    Insert comments above ADD NEW COMMENT and index their markers without
+    rescanning the view.
+    '''
+    snippet, lines = format_comments(comments, collapsed)
+    structure = get_structure(view)
+    point = structure.markers()['add_comment'][0].a
+    view.run_command("insert_issue_snippet", {"snippet": snippet, "start_point": point})
+    structure.add_comments(point, lines)
+
+
+def clear_new_comment(view):
+    '''
+    Empty the new comment area and put the cursor in it.
+    '''
+    markers = get_structure(view).markers()
+    a, b = markers['add_comment'][0].b, markers['content_end'][0].a
+    view.run_command("replace_snippet", {"start_point": a, "end_point": b, "snippet": LINE_END * 2})
+    view.sel().clear()
+    view.sel().add(sublime.Region(a + 1, a + 1))
+
+
+def format_collapsed(comment):
+    '''
+    The one line placeholder of a comment of a large issue.
+    '''
+    return "{} {}, {}, {:.1f} KB{}".format(COMMENT_COLLAPSED(comment['id']), comment['user']['login'],
+                                          comment['updated_at'][:10], len(comment['body']) / 1024.0,
+                                          LINE_END)
 
 
 def shape_comment(comment_info):
@@ -138,7 +173,7 @@ def format_comment(comment):
     snippet += shape_comment(comment_info) + LINE_END
     snippet += filter_fake_crucial_lines(filter_line_ends(comment['body'])) + LINE_END
     snippet += COMMENT_END(comment['id']) + LINE_END
-    log("comment id " + str(comment['id']) + "formated")
+    log("comment id {}formated", comment['id'])
     return snippet
 
 
@@ -199,26 +234,26 @@ class ViewConverter:
         for key, value in info_dict.items():
             prepared_key = key.lower()
             if value == 'False':
-                log(str(key) + " value is " + value)
+                log("{} value is {}", key, value)
                 prepared_value = False
             elif value == 'True':
-                log(str(key) + " value is " + value)
+                log("{} value is {}", key, value)
                 prepared_value = True
             elif value == 'None':
-                log(str(key) + " value is " + value)
+                log("{} value is {}", key, value)
                 prepared_value = None
             elif value.isdigit():
-                log(str(key) + " value is " + value)
+                log("{} value is {}", key, value)
                 prepared_value = int(value)
             elif prepared_key == 'label':
-                log(str(key) + " value is " + value)
+                log("{} value is {}", key, value)
                 prepared_value = set([x.strip() for x in value.split('@')])
-                log("prepared value is {}".format(str(prepared_value)))
+                log("prepared value is {}", prepared_value)
                 try:
                     prepared_value.remove('')
                 except KeyError:
                     pass
-                log("labels are " + str(prepared_value))
+                log("labels are {}", prepared_value)
             else:
                 prepared_value = value
             prepared_dict[prepared_key] = prepared_value
@@ -250,28 +285,11 @@ class ViewConverter:
     def split_issue(lines):
         crucial_line = {}
         line_order = []
+        classify = marker_table.get("line").match
         for idx, line in enumerate(lines):
-            if line.strip().startswith(HEADER_END()):
-                line_order.append(CrucialLine("header_end", idx))
-            elif line.strip().startswith(ISSUE_START()):
-                line_order.append(CrucialLine("issue_start", idx))
-            elif line.strip().startswith(ISSUE_END()):
-                line_order.append(CrucialLine("issue_end", idx))
-            elif re.match(r'^\*<+START\s+<Comment', line.strip()):
-                line_order.append(
-                    CrucialLine("comment_start", idx, int(
-                        re.match(r"(\D+)(\d+)(.+)", line.strip()).group(2))))
-            elif re.match(r'^\*>+END\s+<Comment', line.strip()):
-                line_order.append(
-                    CrucialLine("comment_end", idx, int(
-                        re.match(r"(\D+)(\d+)(.+)", line.strip()).group(2))))
-            elif line.strip().startswith(ADD_COMMENT()):
-                line_order.append(CrucialLine("add_comment", idx))
-            elif line.strip().startswith(CONTENT_END()):
-                line_order.append(CrucialLine("content_end", idx))
-            else:
-                pass
-        line_order.sort(key=lambda x: x.idx)
+            matched = classify(line)
+            if matched:
+                line_order.append(CrucialLine(matched.lastgroup, idx, marker_id(matched)))
         view_lines_structure = LineLinkList()
         for line in line_order:
             view_lines_structure.add_node(line)
@@ -285,13 +303,10 @@ class ViewConverter:
             after_purify = view_lines_structure.number
             if before_purify == after_purify:
                 break
-        for crucial in ('issue_start', 'header_end', 'issue_end',
-                        'comment_start', 'comment_end', 'add_comment',
-                        'content_end'):
+        for crucial in MARKER_TYPES:
             crucial_line[crucial] = view_lines_structure.forward_search(
                 view_lines_structure.head, crucial)
-            log("the crucial_line[{}] is {}".format(crucial, repr(
-                crucial_line[crucial])))
+            log("the crucial_line[{}] is {!r}", crucial, crucial_line[crucial])
         duplicated = []
         for item in ('issue_start', 'header_end', 'issue_end', 'add_comment',
                      'content_end'):
@@ -318,107 +333,263 @@ class ViewConverter:
                 info_dict[key] = value
             except:
                 pass
-        log("issue_header is " + str(info_dict))
+        log("issue_header is {}", info_dict)
         return info_dict
 
-    @staticmethod
-    def get_issue_body(lines, crucial_lines):
-        return '\n'.join(lines[crucial_lines['issue_start'][0].idx + 1:
-                               crucial_lines['issue_end'][0].idx])
-        # else:
-        #     if len(crucial_lines['ADD_COMMENT()']) > 0:
-        #         return '\n'.join(lines[crucial_lines['ISSUE_START()'][0].idx + 1:
-        #                                crucial_lines['ADD_COMMENT()'][0].idx])
-        #     else:
-        #         return '\n'.join(lines[crucial_lines['ISSUE_START()'][0].idx + 1:
-        #                                crucial_lines['ISSUE_END()'][0].idx])
-
-    @staticmethod
-    def get_comment_list(lines, crucial_lines):
-        comment_dict = {}
-        if len(crucial_lines['comment_start']) > 0:
-            number_of_comments = len(crucial_lines['comment_start'])
-            comment_pointer = 0
-            while comment_pointer < number_of_comments:
-                if crucial_lines['comment_start'][
-                        comment_pointer].id != crucial_lines['comment_end'][
-                            comment_pointer].id:
-                    raise Exception(
-                        "comment start and end numbers do not match")
-                comment_headline_number = crucial_lines['comment_start'][
-                    comment_pointer].idx
-                comment_endline_number = crucial_lines['comment_end'][
-                    comment_pointer].idx
-                comment_id = crucial_lines['comment_start'][comment_pointer].id
-                comment_body = '\n'.join(lines[comment_headline_number + 2:
-                                               comment_endline_number])
-                comment_dict[comment_id] = comment_body
-                comment_pointer += 1
-        return comment_dict
 
-    @staticmethod
-    def get_new_comment(lines, crucial_lines):
-        if len(crucial_lines['add_comment']) > 0:
-            return '\n'.join(lines[crucial_lines['add_comment'][0].idx + 1:
-                                   crucial_lines['content_end'][0].idx]).strip()
-        return ""
+def get_issue_post(view):
+    with span("parse"):
+        return read_issue_post(view)
 
 
-def get_issue_post(view):
-    view_converter = ViewConverter(view)
-    view_lines = view_converter.readlines()
-    crucial_lines = ViewConverter.split_issue(view_lines)
-    header = view_lines[:crucial_lines["header_end"][0].idx]
+def read_issue_post(view):
+    markers = get_structure(view).markers()
+    header = view.substr(sublime.Region(0, markers['header_end'][0].a)).split(LINE_END)
     issue_post = ViewConverter.generate_issue_header(header)
     issue_post = ViewConverter.prepare_post(issue_post)
-    issue_post['body'] = ViewConverter.get_issue_body(view_lines,
-                                                      crucial_lines)
-    comment_dict = ViewConverter.get_comment_list(view_lines, crucial_lines)
-    new_comment = ViewConverter.get_new_comment(view_lines, crucial_lines)
-    log("new comment is {}".format(new_comment))
+    issue_post['body'] = text_between(view, markers['issue_start'][0], markers['issue_end'][0])
+    comment_dict = {}
+    collapsed = set(marker.id for marker in markers['comment_collapsed'])
+    for start, end in zip(markers['comment_start'], markers['comment_end']):
+        if start.id != end.id:
+            raise Exception("comment start and end numbers do not match")
+        comment_dict[start.id] = text_between(view, view.line(start.b + 1), end)
+    new_comment = ""
+    if markers['add_comment']:
+        new_comment = text_between(view, markers['add_comment'][0], markers['content_end'][0]).strip()
+    log("new comment is {}", new_comment)
     return {'issue': issue_post,
             'label': issue_post.pop("label"),
             'comments': comment_dict,
+            'collapsed': collapsed,
             'new_comment': new_comment}
 
 
+def text_between(view, start_line, end_line):
+    '''
+    The lines strictly between two line regions.
+    '''
+    begin = min(start_line.b + 1, end_line.a)
+    return view.substr(sublime.Region(begin, max(begin, end_line.a - 1)))
+
+
 def find_comment_region(view):
-    view_converter = ViewConverter(view)
-    a, _, _, b = view_converter.find_region_line(ADD_COMMENT(), CONTENT_END())
-    return (a, b)
+    markers = get_structure(view).markers()
+    return (markers['add_comment'][0].a, markers['content_end'][0].b)
+
+
+MARKER_TYPES = ('issue_start', 'header_end', 'issue_end', 'comment_start',
+                'comment_end', 'comment_collapsed', 'add_comment', 'content_end')
+COMMENT_TYPES = ('comment_start', 'comment_end', 'comment_collapsed')
+
+
+class Marker(sublime.Region):
+    '''
+    Line region of a marker, with the comment id for comment markers.
+    '''
+
+    def __init__(self, a, b, id=0):
+        super(Marker, self).__init__(a, b)
+        self.id = id
+
+
+class IssueStructure:
+    '''
+    Marker lines of an issue view kept as hidden regions, which Sublime moves
+    along with every edit. The view is scanned again only when a marker line
+    was edited or a snippet containing markers was inserted.
+    '''
+
+    def __init__(self, view):
+        self.view = view
+        self.dirty = True
+
+    @staticmethod
+    def key(line_type):
+        return "github_issue_" + line_type
+
+    def build(self):
+        with span("parse"):
+            self.index()
+
+    def index(self):
+        line_regions = self.view.lines(sublime.Region(0, self.view.size()))
+        lines = [self.view.substr(region) for region in line_regions]
+        crucial_lines = ViewConverter.split_issue(lines)
+        for line_type in MARKER_TYPES:
+            self.view.add_regions(self.key(line_type),
+                                  [line_regions[line.idx] for line in crucial_lines[line_type]],
+                                  "", "", sublime.HIDDEN)
+        self.dirty = False
+        log("indexed {} comments of the issue view", len(crucial_lines['comment_start']))
+
+    def add_comments(self, point, lines):
+        '''
+        Track the markers of comments inserted at point by the plug-in.
+        '''
+        for line_type, offsets in lines.items():
+            regions = self.view.get_regions(self.key(line_type))
+            regions.extend(sublime.Region(point + a, point + b) for a, b in offsets)
+            regions.sort(key=lambda region: region.a)
+            self.view.add_regions(self.key(line_type), regions, "", "", sublime.HIDDEN)
+        self.dirty = False
+
+    def expand(self, marker, comment):
+        '''
+        Replace the placeholder of a collapsed comment with the full comment.
+        '''
+        key = self.key('comment_collapsed')
+        self.view.add_regions(key, [region for region in self.view.get_regions(key) if region.a != marker.a],
+                              "", "", sublime.HIDDEN)
+        snippet, lines = format_comments([comment])
+        self.view.run_command("replace_snippet", {"start_point": marker.a,
+                                                  "end_point": marker.b + len(LINE_END),
+                                                  "snippet": snippet})
+        self.add_comments(marker.a, lines)
+
+    def markers(self):
+        '''
+        The marker lines by type; O(markers) unless the view must be rescanned.
+        '''
+        markers = None if self.dirty else self.read()
+        if markers is None:
+            self.build()
+            markers = self.read()
+            if markers is None:
+                raise Exception("Cannot locate the issue markers!")
+        return markers
+
+    def read(self):
+        '''
+        The tracked marker lines, or None if they no longer match the view.
+        Marker lines the regions do not know about (brought back by undo,
+        drag and drop or typing) are caught by the listener, which marks the
+        structure dirty.
+        '''
+        classify = marker_table.get("line").match
+        markers = {}
+        for line_type in MARKER_TYPES:
+            found = []
+            for region in self.view.get_regions(self.key(line_type)):
+                if region.empty() and line_type in COMMENT_TYPES:
+                    continue
+                if self.view.line(region.a) != region:
+                    return None
+                matched = classify(self.view.substr(region))
+                if not matched or matched.lastgroup != line_type:
+                    return None
+                found.append(Marker(region.a, region.b, marker_id(matched)))
+            markers[line_type] = found
+        if len(markers['comment_start']) != len(markers['comment_end']):
+            return None
+        for line_type in ('issue_start', 'header_end', 'issue_end', 'content_end'):
+            if len(markers[line_type]) != 1:
+                return None
+        return markers
+
+
+def marker_id(matched):
+    return int(matched.group("start_id") or matched.group("end_id") or matched.group("collapsed_id") or 0)
+
+
+def collapsed_comment_at(view, point):
+    '''
+    The id of the collapsed comment whose placeholder holds point, if any.
+    '''
+    line = view.line(point)
+    matched = marker_table.get("line").match(view.substr(line))
+    if not matched or matched.lastgroup != 'comment_collapsed':
+        return None
+    return marker_id(matched)
+
+
+def load_comment(view, comment_id):
+    '''
+    Read a collapsed comment from the local issue store, off the UI thread.
+    '''
+    try:
+        username, repo_name, _ = repo_info_storage[view.id()]
+    except KeyError:
+        return None
+    return issue_store.get_comment("{}/{}".format(username, repo_name), comment_id)
+
+
+def expand_comment(view, comment_id, comment):
+    '''
+    Expand a collapsed comment in place with the comment read by load_comment.
+    '''
+    structure = get_structure(view)
+    for marker in structure.markers()['comment_collapsed']:
+        if marker.id == comment_id:
+            break
+    else:
+        return False
+    view.set_read_only(False)
+    structure.expand(marker, comment)
+    log("expand the comment {}", comment_id)
+    return True
+
+
+issue_structures = {}
+
+
+def get_structure(view):
+    structure = issue_structures.get(view.id())
+    if structure is None or structure.view != view:
+        structure = IssueStructure(view)
+        issue_structures[view.id()] = structure
+    return structure
+
+
+def drop_structure(view_id):
+    issue_structures.pop(view_id, None)
+
+
+def mark_structure_dirty(view, snippet=None):
+    '''
+    Called by the snippet commands: a snippet with marker lines must be indexed.
+    '''
+    structure = issue_structures.get(view.id())
+    if structure and (snippet is None or MARKER_HINT.search(snippet)):
+        structure.dirty = True
+
+
+MARKER_HINT = re.compile(r'(^|\n)\s*\*[<>=-]{2}')
 
 
 def compare_issues(original_issue, issue_in_view):
     modified_keys = set(issue_in_view['issue'].keys())
-    original_keys = set(original_issue['issue'].keys())
+    original_keys = set(original_issue.issue.keys())
     intersection_keys = modified_keys.intersection(original_keys)
-    log("intersection_keys are" + str(intersection_keys))
+    log("intersection_keys are{}", intersection_keys)
     modified_part = {
         key: issue_in_view['issue'][key]
         for key in intersection_keys
-        if original_issue['issue'][key] != issue_in_view['issue'][key]
+        if original_issue.issue[key] != issue_in_view['issue'][key]
     }
     additional_keys = modified_keys.difference(original_keys)
     if additional_keys:
         additional_part = {key: issue_in_view['issue'][key]
                            for key in additional_keys}
         modified_part.update(additional_part)
-    log('original_issue is' + str(original_issue['issue']))
-    log("modified_parts are " + str(modified_part))
+    log("original_issue is{}", original_issue.issue)
+    log("modified_parts are {}", modified_part)
     new_label = -1
-    if original_issue['label'] != issue_in_view['label']:
+    if original_issue.label != issue_in_view['label']:
         new_label = issue_in_view['label']
     modified_comments = {}
     comment_ids_in_view = set(issue_in_view['comments'].keys())
-    original_comment_ids = set(original_issue['comments'].keys())
-    deleted_comments = original_comment_ids.difference(comment_ids_in_view)
+    original_comment_ids = set(original_issue.comments.keys())
+    # collapsed comments are not in the view and stay as they are
+    deleted_comments = original_comment_ids.difference(comment_ids_in_view).difference(
+        issue_in_view.get('collapsed', ()))
     for comment_id in issue_in_view['comments'].keys():
-        if issue_in_view['comments'][comment_id] != original_issue['comments'][
-                comment_id]['body']:
+        if issue_in_view['comments'][comment_id] != original_issue.comments[
+                comment_id].body:
             modified_comments[comment_id] = issue_in_view['comments'][
                 comment_id]
-    log("original_comments are " + str(original_issue["comments"]))
-    log("modified_comments are " + str(modified_comments))
+    log("original_comments are {}", original_issue.comments)
+    log("modified_comments are {}", modified_comments)
     return (modified_part, new_label, modified_comments, deleted_comments)
 
 
@@ -496,19 +667,22 @@ class LineLinkList:
                 return False
             return True
         if node.line_type == "issue_end":
-            if node.next.line_type != "comment_start" and node.next.line_type != "add_comment" and node.next.line_type != "content_end":
+            if node.next.line_type not in ("comment_start", "comment_collapsed", "add_comment", "content_end"):
                 return False
             return True
-        if node.line_type == "comment_start":
-            if node.prev.line_type != "issue_end" and node.prev.line_type != "comment_end":
+        if node.line_type in ("comment_start", "comment_collapsed"):
+            if node.prev.line_type not in ("issue_end", "comment_end", "comment_collapsed"):
+                return False
+            if node.line_type == "comment_collapsed" and node.next.line_type not in (
+                    "comment_start", "comment_collapsed", "add_comment"):
                 return False
             return True
         if node.line_type == "comment_end":
-            if node.next.line_type != "comment_start" and node.next.line_type != "add_comment":
+            if node.next.line_type not in ("comment_start", "comment_collapsed", "add_comment"):
                 return False
             return True
         if node.line_type == "add_comment":
-            if node.prev.line_type != "comment_end" and node.prev.line_type != "issue_end":
+            if node.prev.line_type not in ("comment_end", "comment_collapsed", "issue_end"):
                 return False
             return True
 
@@ -0,0 +1,199 @@
+import time
+import queue
+import itertools
+import threading
+import traceback
+from .. import log, logger
+from .scheduler import INTERACTIVE, BACKGROUND
+
+
+class CancelToken:
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class JobHandle:
+
+    def __init__(self, job, token):
+        self.job = job
+        self.token = token
+        self.done = threading.Event()
+        self.error = None
+
+    def cancel(self):
+        self.token.cancel()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+
+class WorkerExecutor:
+    '''
+    Bounded pool running Job objects by priority. Jobs sharing a cancel key
+    follow "latest wins": submitting a new one cancels the previous one.
+    '''
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self.queue = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.tokens = {}
+        self.running = 0
+        self.completed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.total_run_time = 0.0
+        self.max_run_time = 0.0
+        self.total_queue_time = 0.0
+
+    def submit(self, job):
+        token = CancelToken()
+        key = job.cancel_key()
+        with self.lock:
+            if key is not None:
+                previous = self.tokens.get(key)
+                if previous:
+                    previous.cancel()
+                self.tokens[key] = token
+            if len(self.threads) < self.max_workers:
+                thread = threading.Thread(target=self.work, name="GitHubIssue-{}-{}".format(
+                    self.name, len(self.threads)))
+                thread.daemon = True
+                self.threads.append(thread)
+                thread.start()
+        job.token = token
+        handle = JobHandle(job, token)
+        self.queue.put((job.priority, next(self.counter), time.time(), handle))
+        return handle
+
+    def register(self, job):
+        '''
+        File a running job under its cancel key, for jobs whose key is only
+        known once they run.
+        '''
+        key = job.cancel_key()
+        if key is None:
+            return
+        with self.lock:
+            previous = self.tokens.get(key)
+            if previous and previous is not job.token:
+                previous.cancel()
+            self.tokens[key] = job.token
+
+    def cancel_view(self, view_id):
+        with self.lock:
+            for key in list(self.tokens.keys()):
+                if key[0] == view_id:
+                    self.tokens.pop(key).cancel()
+
+    def work(self):
+        while True:
+            _, _, queued_at, handle = self.queue.get()
+            start = time.time()
+            with self.lock:
+                self.total_queue_time += start - queued_at
+                if handle.cancelled:
+                    self.dropped += 1
+                    handle.done.set()
+                    continue
+                self.running += 1
+            trace = logger.begin_trace(type(handle.job).__name__)
+            try:
+                handle.job.run()
+            except Exception as error:
+                handle.error = error
+                with self.lock:
+                    self.failed += 1
+                traceback.print_exc()
+            finally:
+                logger.end_trace(trace)
+                elapsed = time.time() - start
+                key = handle.job.cancel_key()
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.total_run_time += elapsed
+                    self.max_run_time = max(self.max_run_time, elapsed)
+                    if key is not None and self.tokens.get(key) is handle.token:
+                        del self.tokens[key]
+                handle.done.set()
+                log("{} finished in {:.3f}s", type(handle.job).__name__, elapsed)
+
+    def stats(self):
+        with self.lock:
+            finished = self.completed + self.dropped
+            return {"name": self.name,
+                    "workers": len(self.threads),
+                    "queued": self.queue.qsize(),
+                    "running": self.running,
+                    "completed": self.completed,
+                    "dropped": self.dropped,
+                    "failed": self.failed,
+                    "average_run_time": self.total_run_time / self.completed if self.completed else 0.0,
+                    "max_run_time": self.max_run_time,
+                    "average_queue_time": self.total_queue_time / finished if finished else 0.0}
+
+
+workers = WorkerExecutor("foreground", 4)
+background_workers = WorkerExecutor("background", 2)
+
+
+def cancel_view(view_id):
+    workers.cancel_view(view_id)
+    background_workers.cancel_view(view_id)
+
+
+class Job:
+    '''
+    Unit of background work, started like a thread but run by the shared
+    executors. Subclasses check self.cancelled before touching a view.
+    '''
+    priority = INTERACTIVE
+    channel = None
+
+    def __init__(self):
+        self.token = CancelToken()
+
+    def cancel_key(self):
+        view = getattr(self, "view", None)
+        if self.channel and view is not None:
+            return (view.id(), self.channel)
+        return None
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def start(self):
+        return self.executor().submit(self)
+
+    def executor(self):
+        if self.priority >= BACKGROUND:
+            return background_workers
+        return workers
+
+    def bind_view(self, view):
+        '''
+        Attach the view a running job created, so that closing it or starting
+        a newer job on it cancels this one.
+        '''
+        self.view = view
+        self.executor().register(self)
+
+    def run(self):
+        '''
+        The work itself, overridden by subclasses. Like Thread.run, the base
+        job does nothing.
+        '''
+        pass